@@ -1,88 +1,82 @@
 # This code will take in a training set and make the categorical distributions for it
 #   and output it into a csv file. 
 #
+# It can also add rows to (or take rows out of) a signature that was already made, without going over the old
+#   rows again. Give it the signature to start from as a third arguement, and a csv of the rows to take out as
+#   an optional fourth:
+#   python3 "Categorical Distribution Creation.py" new_rows_keywords.csv class_words_0.npz class_words_0.npz [removed_rows_keywords.csv]
+#   The job_ids of the rows in a signature are saved in it, so rows that are already in it are skipped and
+#   running the same rows again does not change it.
+#
 # Author: Joshua White
 # Sources:
 #    https://www.psycopg.org/
 #    https://www.psycopg.org/docs/usage.html
 
-import psycopg2
 import pandas as pd
-import pickle
 import sys
+import traversal
+import graph_access
+import signature_store
+import async_graph
+import kfold_signatures
+import signature_settings
 
 ### Variable Setup #################################################################################################################
 
 # Grab the command line arguements
 training_set_keywords = sys.argv[1]       # Should look something like "training_set_0_keywords.csv"
-pickle_out = sys.argv[2]              # Should look something like "class_words_0.P"
-
-# We will connect to the database here, while printing some useful terminal text:
-print("Connecting to the Database...")
-conn = psycopg2.connect("dbname=conceptnet5 user=postgres host=localhost")
-print("Connection established.")
-
-#Nodes table strings
-nodes_select_string = "SELECT id,uri FROM nodes WHERE uri LIKE '/c/en/"
-
-#Edges table strings, used to get the edges for words
-edges_select_string = "SELECT id,uri,relation_id,start_id,end_id,weight FROM edges WHERE start_id = "
-and_weight_string = " AND weight > "
-or_string = " OR end_id = "
-edges_string_ending = ";"
-
-#Select endings
-select_string_ending = "';"
-select_string_ending_percent = "%';"
-select_string_ending_slash_percent = "/%';"
-select_string_ending_noun = "/n';"
-
-# The minimum_weight for an edge to be considered when building the subgraph
-minimum_weight = 4
-
-# The number of edges to search out from. A tail_length of 3 means we will search out 3 edges, or 4 nodes out from the keyword.  
-#     THIS MUST BE AT LEAST 2!
-tail_length = 2
+pickle_out = sys.argv[2]              # Should look something like "class_words_0.npz", a ".P" name is saved as a pickle
+base_signature = None                 # The signature to add the rows to, if there is one
+if len(sys.argv) > 3:
+    base_signature = sys.argv[3]      # Should look something like "class_words_0.npz"
+removed_keywords = None               # The csv of the rows to take out of the base_signature, if there is one
+if len(sys.argv) > 4:
+    removed_keywords = sys.argv[4]    # Should look something like "removed_rows_keywords.csv"
+
+# The settings the signature is made with are in signature_settings.py, so kfold_signatures.py makes the
+#    signatures the same way
+local_graph_folder = signature_settings.local_graph_folder
+minimum_weight = signature_settings.minimum_weight
+tail_length = signature_settings.tail_length
+depth_width = signature_settings.depth_width
+async_prefetch = signature_settings.async_prefetch
+recursive_tails = signature_settings.recursive_tails
+worker_count = signature_settings.worker_count
+tail_memo_max_size = signature_settings.tail_memo_max_size
+
+# We will connect to the database (or load the local subgraph) here, everything about how ConceptNet is stored
+#    and cached is in graph_access.py
+graph = graph_access.open_graph(local_graph_folder)
 
 # Set up the pandas frame on an already preprocessed file:
 Keyword_Frame = pd.read_csv(training_set_keywords)
 
+# The rows to take out of the base_signature, same format as the training set
+if removed_keywords is None:
+    Removed_Frame = Keyword_Frame.iloc[0:0]
+else:
+    Removed_Frame = pd.read_csv(removed_keywords)
+
 # This block is no longer necessary after the preprocessing script update
 # Set up the pandas fram on the categories data:
 #CatFrame = pd.read_csv('nyc-jobs_categories.csv')
 
-# This dictionary will hold dictionaries of all of the words (as conceptnet URIs) for each class, as well as how many times it was each node. 
-#    So an example of what the dictionary will look like when it's filled out is:
-#    {'1':{<conceptnet uri>, [1,0,5,0]}, ...}
-class_words = {
-    1 : {},
-    2 : {},
-    3 : {},
-    4 : {},
-    5 : {},
-    6 : {},
-    7 : {},
-    8 : {},
-    9 : {},
-    10 : {},
-    11 : {},
-    12 : {},
-}
-
-class_words = {
-    1 : {},
-    2 : {},
-    3 : {},
-    4 : {},
-    5 : {},
-    6 : {},
-    7 : {},
-    8 : {},
-    9 : {},
-    10 : {},
-    11 : {},
-    12 : {},
-}
+# This will hold all of the words (as conceptnet URIs) for each class, as well as how many times it was each node.
+#    It acts like a dictionary of dictionaries, so an example of what it looks like when it's filled out is:
+#    {'1':{<conceptnet uri>, [1,0,5,0,0,0]}, ...}
+#    but the counts are stored in compact arrays, see signature_store.py
+if base_signature is None:
+    class_words = signature_store.SignatureStore(range(1, 13), depth_width)
+else:
+    class_words = signature_store.load_signature(base_signature)
+    # A signature made with a shorter tail_length has no room for the deeper counts
+    if class_words.depth_width <= tail_length:
+        raise ValueError(base_signature + " has a depth_width of " + str(class_words.depth_width) + ", it can not hold the counts of a tail_length of " + str(tail_length))
+    print("Loaded", base_signature, "with", len(class_words.job_ids), "rows in it.")
+
+# The rows that were already in the signature before this run, these are skipped
+included_job_ids = set(class_words.job_ids)
 
 # This list will contain a tuple for every time a word is queried in conceptnet and isn't in there. It will be stored
 #    in a tuple of the (<missed word>, <associated job_id>)
@@ -91,71 +85,33 @@ query_log = []
 # Used to make sure there are no cycles 
 edge_check = set()
 
+# The edges fetched for the current row, {node_id : [edges]}, so no node has its edges queried twice for the same row
+neighbourhoods = {}
+
 ### Functions ######################################################################################################################
 
-# Returns a cursor for a query of the input word. Does not add a % to the end 
-#    of the query. 
-#Input: The word to search for
-#Return: Cursor object from the execute() 
+# Returns the (id, uri) rows of the node for the input word. The results are remembered by the
+#    graph's node resolver, so each word is only queried once.
+# Input: The word to search for
+# Return: List of the (id, uri) rows, empty if the word is not in ConceptNet
 def query_node(base_word):
-    cur = conn.cursor()
-    full_search_string = nodes_select_string + base_word + select_string_ending
-    cur.execute(full_search_string)
-    node_results = cur.fetchall()
-    cur.close()
-    return node_results
-
-# Returns a cursor for a query of the input word. Adds a wildcard regex operator to the
-#    end of the query. 
-# Input: The word to search for 
-# Return: Cursor object from the execute() 
-def query_node_percent(base_word):
-    cur = conn.cursor()
-    full_search_string = nodes_select_string + base_word + select_string_ending_percent
-    cur.execute(full_search_string)
-    return cur
-
-# Returns a cursor for a query of the input word. Adds a wildcard regex operator to the
-#    end of the query. 
-# Input: The word to search for 
-# Return: Cursor object from the execute() 
-def query_node_slash_percent(base_word):
-    cur = conn.cursor()
-    full_search_string = nodes_select_string + base_word + select_string_ending_slash_percent
-    cur.execute(full_search_string)
-    return cur
-
-# Returns a cursor for a query of the input word. Does not add a % to the end 
-#    of the query, but does query all of the noun forms of the base word
-# Input: The word to search for 
-# Return: Cursor object from the execute() 
-def query_node_noun(base_word):
-    cur = conn.cursor()
-    full_search_string = nodes_select_string + base_word + select_string_ending_noun
-    cur.execute(full_search_string)
-    return cur
-
-# Returns a cursor for a query of the input node id on the start_id & end_id of the edges
-#    table that has a weight higher than the minimum_weight in the ConceptNet5 database. 
-#    This was tested to ensure that the node_id is queried for the start & end id. 
-# Input: The node id to search for 
-# Return: Cursor object from the execute() 
-#    The  returned edges are in the following format: id, uri, relation_id, start_id, end_id, weight
-def query_edges(node_id):
-    cur = conn.cursor()
-    full_search_string = edges_select_string + str(node_id) + and_weight_string + str(minimum_weight) + or_string + str(node_id) + and_weight_string + str(minimum_weight) + edges_string_ending
-    #print(full_search_string) #used for testing
-    cur.execute(full_search_string)
-    edge_results = cur.fetchall()
-    cur.close()
-    return edge_results
-
-# Given a job_id return an integer of the class the file belongs too. This function uses the information from  
-#    'nyc-jobs_categories.csv' to get the class. 
+    return graph.resolve(base_word)
+
+# Returns all of the edges with a weight higher than the minimum_weight for every node id in node_ids at once.
+#    This is used to grab a whole depth level (frontier) of the traversal.
+# Input: An iterable of node ids to search for
+# Return: Dictionary of {node_id : [edges]}, every node id in node_ids gets a (possibly empty) list.
+#    The edges are in the following format: id, uri, relation_id, start_id, end_id, weight, and are ordered by edge id.
+#    An edge between two of the input nodes is in both of their lists.
+def query_edges_many(node_ids):
+    return graph.neighbors_many(node_ids, minimum_weight)
+
+# Given a job_id return an integer of the class the file belongs too. This function uses the information from
+#    'nyc-jobs_categories.csv' to get the class.
 # Input: The job id of a row in the training set
 # Output: the class of that job_id
 #def get_class_int(id):
-    #This line gets the row where the value of 'Job ID' = job_id, then gets the "Category" value 
+    #This line gets the row where the value of 'Job ID' = job_id, then gets the "Category" value
     #return CatFrame.loc[CatFrame['Job ID'] == int(id)].iloc[0,9]
 
 # This helper function updates the class_words dictionary. This allows use to dynamically change 
@@ -164,50 +120,48 @@ def query_edges(node_id):
 #        uri = the string uri from conceptnet of the word you wish to update
 #        tail_depth = how far the tail of the keyword you currently are. A tail_depth of 0 would means you are adding a keyword
 #                        where a tail_depth of 2 would mean you are 2 edges into a tail (on the third node)
+#        amount = what to add to the count, -1 takes a row's count back out
 # Output: None
-def update_class_words(category, uri, tail_depth):
+def update_class_words(category, uri, tail_depth, amount=1):
     # Make sure all of the uri's don't end with a ']' but with a '/'
-    if uri[-1] == ']':
-        uri = uri[:-1]
-    if uri[-1] != '/':
-        uri += '/'
+    uri = traversal.clean_uri(uri)
     global class_words # So we are modifying the global version of class_words
-    # First check if the uri has not been added, if it hasn't add it 
-    if uri not in class_words[category]:
-        # First just make the inner set empty
-        class_words[category].update({uri : [0, 0, 0, 0, 0, 0, 0, 0, 0, 0]})
-    # Then update the inner set with the tail_depth, just by adding 1 to it
-    class_words[category][uri][tail_depth] = class_words[category][uri][tail_depth] + 1
-
-# Takes the origional id, edge tuple from the conceptnet query, category and tail depth 
-#    and returns the other edge id after adding it to the class_words dict. 
-def add_edge(node_id, edge, category, tail_depth):
-    split_uri = edge[1].split(',')
-    # If the id is the start_id
-    if node_id == edge[3]:
-        update_class_words(category, split_uri[1], tail_depth)
-        return edge[4]
-    update_class_words(category, split_uri[2], tail_depth)
-    return edge[3]
-
-# This is a recursive function that will continue to go out a tail for the input id. Does not return anything.
-#    There is cycle checking in this function. 
-def next_layer(node_id, current_category, current_depth):
-    global tail_length
-    global edge_check
-    # Get all the edges from our id
-    edge_results = query_edges(node_id)
-    # If there were no edges from this id just return
-    if len(edge_results) == 0:
+    # Add to the count of the uri at the tail_depth, the uri gets an empty row first if it hasn't been added
+    class_words[category].add(uri, tail_depth, amount)
+
+# Counts one row of the training set into class_words: every keyword and every node out its tail.
+# Input: keywords = the keywords string of the row
+#        current_category = the category of the row
+#        job_id = the job id of the row, used for the query_log
+#        amount = 1 to add the row, -1 to take it back out
+# Output: None
+def count_row(keywords, current_category, job_id, amount):
+    # If the row was already walked by a worker, just count what it found
+    if keywords in row_walks:
+        entries, missing_words = row_walks[keywords]
+        for a in missing_words:
+            query_log.append((a, job_id))
+            print("Word not found in ConceptNet and logged. Word is: " + a)
+        for uri, depth, count in entries:
+            update_class_words(current_category, uri, depth, count * amount)
         return
-    for iter1 in edge_results:
-        # Checking for cycles here:
-        if iter1[0] not in edge_check:
-            edge_check.add(iter1[0])
-            other_id = add_edge(node_id, iter1, current_category, current_depth)
-            #print(other_id) # For debugging
-            if current_depth < tail_length:
-                next_layer(other_id, current_category, current_depth + 1)
+    edge_check.clear()
+    neighbourhoods.clear()
+    # Loop over all keywords
+    for a in keywords.split():
+        keyword_results = query_node(a) # Keyword_results is currently a list of the id and uri 
+        # If no result returned add it to the log
+        if len(keyword_results) == 0:
+            query_log.append((a, job_id))
+            print("Word not found in ConceptNet and logged. Word is: " + a)
+            continue
+
+        update_class_words(current_category, keyword_results[0][1], 0, amount) # Add the keyword to the dict
+        keyword_id = keyword_results[0][0] # Grab the id for the edge query
+        # Go out the tail, adding every node we reach to the dict as many times as it was reached.
+        #    A keyword that has been seen before gets its remembered tail instead of walking it again.
+        for uri, depth, count in tail_memo.tail_counts(keyword_id, edge_check, neighbourhoods):
+            update_class_words(current_category, uri, depth, count * amount)
 
 ### Main Code ########################################################################################################################
 
@@ -220,45 +174,68 @@ def next_layer(node_id, current_category, current_depth):
 # -get all of the edges with a weight above the minimum weight
 # -add the new word
 
+# Remembers the tail of every keyword that has been walked
+fetch_many = None
+if recursive_tails:
+    fetch_many = lambda keyword_ids: graph.tails_many(keyword_ids, tail_length, minimum_weight)
+tail_memo = traversal.TailMemo(query_edges_many, tail_length, tail_memo_max_size, fetch_many)
+
+# Resolve every keyword in the training set with one query up front, query_node() then only hits the node resolver
+#    (the workers do this themselves when there is more than one)
+if worker_count <= 1:
+    resolved_keywords = graph.resolve_many(" ".join(list(Keyword_Frame.keywords) + list(Removed_Frame.keywords)).split())
+    if async_prefetch:
+        async_graph.prefetch_tails(graph, [(resolved_keywords[a][0][0], tail_length) for a in resolved_keywords if len(resolved_keywords[a]) > 0], minimum_weight)
+    tail_memo.remember_many([resolved_keywords[a][0][0] for a in resolved_keywords if len(resolved_keywords[a]) > 0])
+
+# The walks of the rows done by the workers, {keywords string : walk}. Rows with the same keywords have the same walk.
+row_walks = {}
+if worker_count > 1:
+    walk_keywords = [Removed_Frame.keywords.iloc[i] for i in range(len(Removed_Frame)) if int(Removed_Frame.job_id.iloc[i]) in class_words.job_ids]
+    walk_keywords = walk_keywords + [Keyword_Frame.keywords[i] for i in range(len(Keyword_Frame)) if int(Keyword_Frame.job_id[i]) not in included_job_ids]
+    walk_keywords = list(dict.fromkeys(walk_keywords))
+    print("Walking", len(walk_keywords), "rows on", worker_count, "workers.")
+    row_walks = dict(zip(walk_keywords, kfold_signatures.walk_rows(walk_keywords, worker_count, local_graph_folder, minimum_weight, tail_length, tail_memo_max_size, async_prefetch, recursive_tails)))
+
+# Take the removed rows out first, only the ones that are in the signature
+for i in range(len(Removed_Frame)):
+    job_id = int(Removed_Frame.job_id.iloc[i])
+    if job_id not in class_words.job_ids:
+        print("Job id", job_id, "is not in the signature, nothing to take out.")
+        continue
+    print("Taking out the signature of job id:", job_id)
+    count_row(Removed_Frame.keywords.iloc[i], Removed_Frame.category.iloc[i], job_id, -1)
+    class_words.job_ids.discard(job_id)
+    included_job_ids.discard(job_id)
+# Uris that only came from the removed rows have no counts left, take them out
+if len(Removed_Frame) > 0:
+    for category in class_words:
+        class_words[category].drop_empty_rows()
+
 # Iterator to keep track of the current row
 i = 0
 
 # Iterate over every row of the training data frame
 for x in Keyword_Frame.keywords:
-    # Print out the current job id, useful for debugging
-    print("Creating signature for job id:", Keyword_Frame.job_id[i])
-    current_category = Keyword_Frame.category[i]
-    keywords = x.split()
-    edge_check.clear()
-    # Loop over all keywords
-    for a in keywords:
-        keyword_results = query_node(a) # Keyword_results is currently a list of the id and uri 
-        # If no result returned add it to the log
-        if len(keyword_results) == 0:
-            query_log.append((a, Keyword_Frame.job_id[i]))
-            print("Word not found in ConceptNet and logged. Word is: " + a)
-            continue
-
-        update_class_words(current_category, keyword_results[0][1], 0) # Add the keyword to the dict
-        keyword_id = keyword_results[0][0] # Grab the id for the edge query
-        edge_results = query_edges(keyword_id)
-        # Edge results is now a list of all of the edges that contain the keyword now in the following format
-        #    (id, uri, relation_id, start_id, end_id, weight)
-        if len(edge_results) > 0:
-            for iter1 in edge_results: 
-                #edge_check.clear()
-                edge_check.add(iter1[0]) # Testing for cycles
-                # Here other_id is the id of the node that shares an edge with the keyword we queried.
-                other_id = add_edge(keyword_results[0][1], iter1, current_category, 1)
-                next_layer(other_id, current_category, 2)
+    job_id = int(Keyword_Frame.job_id[i])
     i = i + 1
+    # Rows that were already counted into the base_signature are skipped
+    if job_id in included_job_ids:
+        print("Job id", job_id, "is already in the signature, skipping it.")
+        continue
+    # Print out the current job id, useful for debugging
+    print("Creating signature for job id:", job_id)
+    count_row(x, Keyword_Frame.category[i - 1], job_id, 1)
+    class_words.job_ids.add(job_id)
     print("On job ", i, " of ", len(Keyword_Frame.keywords))
     
 
-# Now pickle the class_words dict. 
-print("Creating pickle for the dict class_words.")
-pickle.dump( class_words, open(pickle_out, "wb") )
+# Now save the class_words signature, see signature_store.save_signature() for the format
+print("Saving the class_words signature.")
+signature_store.save_signature(class_words, pickle_out)
+
+print(tail_memo.stats_string())
+print(graph.stats_string())
 
 # Don't forget to close the DB connection
-conn.close()
-print("Connection closed.")
\ No newline at end of file
+graph.close()
@@ -1,5 +1,14 @@
-import subprocess
+import sys
+import time
+import fold_runner
 # This script will handle the creation and updating of the categorical distribution calls. 
+#    The folds are run at the same time, see fold_runner.py. Each fold's update starts as soon as its
+#    creation is done.
+#    With shared_traversal the signatures of all of the folds are made first with one pass over the rows
+#    (see kfold_signatures.py), then only the updates are run at the same time. Both ways make the signatures with
+#    the settings in signature_settings.py.
+#
+# Usage: python3 RunTrial.py [worker_count]
 #
 # Sources:
 # https://stackabuse.com/command-line-arguments-in-python/
@@ -7,18 +16,25 @@ import subprocess
 #
 # Author: Joshua White
 
-# First we will make all of the initial categorical distributions:
-print("Starting the Categorical Distribution Updates.")
-subprocess.run(['python3', "Categorical Distribution Creation.py", "training_set_0_keywords.csv", "class_words_0.P"], shell = False)
-subprocess.run(['python3', "Categorical Distribution Creation.py", "training_set_1_keywords.csv", "class_words_1.P"], shell = False)
-subprocess.run(['python3', "Categorical Distribution Creation.py", "training_set_2_keywords.csv", "class_words_2.P"], shell = False)
-subprocess.run(['python3', "Categorical Distribution Creation.py", "training_set_3_keywords.csv", "class_words_3.P"], shell = False)
-subprocess.run(['python3', "Categorical Distribution Creation.py", "training_set_4_keywords.csv", "class_words_4.P"], shell = False)
+# The number of folds, and how many of them to run at the same time
+num_folds = 5
+worker_count = 5
+if len(sys.argv) > 1:
+    worker_count = int(sys.argv[1])
+
+# Make every fold's signature out of one walk over the rows instead of walking each training set
+shared_traversal = True
+contributions_file = "row_contributions.npz" # Keeps the walked rows for the next trial, None to not keep them
 
-# Then update all of the categorical distributions: 
-print("Starting the Dynamic Categorical Distribution Updates.")
-subprocess.run(['python3', "Dynamic CD Update v2.py", "class_words_0.P", "test_set_0_keywords.csv", "extended_class_words_0.P"], shell = False)
-subprocess.run(['python3', "Dynamic CD Update v2.py", "class_words_1.P", "test_set_1_keywords.csv", "extended_class_words_1.P"], shell = False)
-subprocess.run(['python3', "Dynamic CD Update v2.py", "class_words_2.P", "test_set_2_keywords.csv", "extended_class_words_2.P"], shell = False)
-subprocess.run(['python3', "Dynamic CD Update v2.py", "class_words_3.P", "test_set_3_keywords.csv", "extended_class_words_3.P"], shell = False)
-subprocess.run(['python3', "Dynamic CD Update v2.py", "class_words_4.P", "test_set_4_keywords.csv", "extended_class_words_4.P"], shell = False)
+# Make all of the initial categorical distributions, then update them:
+print("Starting the Categorical Distribution Creation and Updates with", worker_count, "workers.")
+start_time = time.perf_counter()
+if shared_traversal:
+    shared_result = fold_runner.run_shared_creation(num_folds, contributions_file)
+    if shared_result["status"] != 0:
+        print(shared_result["output"])
+        sys.exit("The shared creation failed, see class_words_all_folds.log")
+    results = fold_runner.run_folds(range(num_folds), worker_count, run_creation = False)
+else:
+    results = fold_runner.run_folds(range(num_folds), worker_count)
+fold_runner.print_summary(results, time.perf_counter() - start_time)
@@ -1,5 +1,10 @@
-import subprocess
+import sys
+import time
+import fold_runner
 # This script will handle the categorical distribution calls. 
+#    The folds are run at the same time, see fold_runner.py.
+#
+# Usage: python3 RunUpdate.py [worker_count]
 #
 # Sources:
 # https://stackabuse.com/command-line-arguments-in-python/
@@ -7,10 +12,14 @@ import subprocess
 #
 # Author: Joshua White
 
+# The number of folds, and how many of them to run at the same time
+num_folds = 5
+worker_count = 5
+if len(sys.argv) > 1:
+    worker_count = int(sys.argv[1])
+
 # Then update all of the categorical distributions: 
-print("Starting the Dynamic Categorical Distribution Updates.")
-subprocess.run(['python3', "Dynamic CD Update v2.py", "class_words_0.P", "test_set_0_keywords.csv", "extended_class_words_0.P"], shell = False)
-subprocess.run(['python3', "Dynamic CD Update v2.py", "class_words_1.P", "test_set_1_keywords.csv", "extended_class_words_1.P"], shell = False)
-subprocess.run(['python3', "Dynamic CD Update v2.py", "class_words_2.P", "test_set_2_keywords.csv", "extended_class_words_2.P"], shell = False)
-subprocess.run(['python3', "Dynamic CD Update v2.py", "class_words_3.P", "test_set_3_keywords.csv", "extended_class_words_3.P"], shell = False)
-subprocess.run(['python3', "Dynamic CD Update v2.py", "class_words_4.P", "test_set_4_keywords.csv", "extended_class_words_4.P"], shell = False)
+print("Starting the Dynamic Categorical Distribution Updates with", worker_count, "workers.")
+start_time = time.perf_counter()
+results = fold_runner.run_folds(range(num_folds), worker_count, run_creation = False)
+fold_runner.print_summary(results, time.perf_counter() - start_time)
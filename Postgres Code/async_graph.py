@@ -0,0 +1,157 @@
+# This file holds an asyncio client for the conceptnet5 database, used to fetch the neighbourhoods of many tails
+#    at the same time. A single tail is walked one depth level at a time and every level waits on one query, so
+#    the scripts spend most of their time waiting on round trips to Postgres. Here the tails of many keywords
+#    are walked at once over a bounded pool of connections, so many queries are in flight at the same time.
+#
+# This only fetches. Every neighbourhood it gets is put into the on-disk edge cache (see edge_cache.py), and the
+#    scripts then count the tails in the same order as always, reading the edges out of the cache. So the counts
+#    are the same no matter what order the queries finish in.
+#
+# Back-pressure: only max_walkers tails are walked at once (the rest wait in a queue), and only pool_size
+#    queries are sent at once (the rest wait on a semaphore).
+#
+# It needs psycopg 3 and psycopg_pool (pip install "psycopg[binary]" psycopg_pool), the scripts only use it
+#    when async_prefetch is turned on.
+#
+# Sources:
+#    https://docs.python.org/3/library/asyncio-task.html
+#    https://docs.python.org/3/library/asyncio-queue.html
+#    https://www.psycopg.org/psycopg3/docs/advanced/async.html
+#    https://www.psycopg.org/psycopg3/docs/advanced/pool.html
+
+import asyncio
+import graph_access
+
+### Variable Setup #################################################################################################################
+
+# The number of connections in the pool, this is also the most queries in flight at once
+pool_size = 8
+
+# The most tails being walked at the same time
+max_walkers = 64
+
+### Classes ########################################################################################################################
+
+# The async version of graph_access.PostgresGraph.neighbors_many over a connection pool
+class AsyncPostgresGraph:
+    # Input: connection_string = same as graph_access.connection_string
+    #        pool_size = the number of connections in the pool
+    def __init__(self, connection_string, pool_size):
+        from psycopg_pool import AsyncConnectionPool
+        self.pool = AsyncConnectionPool(connection_string, min_size=pool_size, max_size=pool_size, open=False)
+        self.queries = 0
+
+    async def open(self):
+        await self.pool.open()
+
+    async def close(self):
+        await self.pool.close()
+
+    # Input: node_ids = list of node ids, with no repeats
+    #        minimum_weight = only edges with a weight above this are returned
+    # Return: Dictionary of {node_id : [edges]}, same as graph_access.PostgresGraph.neighbors_many
+    async def neighbors_many(self, node_ids, minimum_weight):
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(graph_access.edges_many_select_string, (node_ids, node_ids, minimum_weight))
+                edge_results = await cur.fetchall()
+        self.queries = self.queries + 1
+        return graph_access.group_edges(node_ids, [tuple(edge) for edge in edge_results])
+
+# Walks many tails at once and puts every neighbourhood it fetches into the edge cache.
+class TailPrefetcher:
+    # Input: fetch_edges_many = coroutine function that takes a list of node ids and returns {node_id : [edges]}
+    #        cache = the edge_cache.EdgeCache to fill
+    #        minimum_weight = the minimum_weight of the edges
+    #        max_in_flight = the most fetch_edges_many calls at once
+    def __init__(self, fetch_edges_many, cache, minimum_weight, max_in_flight):
+        self.fetch_edges_many = fetch_edges_many
+        self.cache = cache
+        self.minimum_weight = minimum_weight
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        # {node_id : future of its edges}, so a node that two tails reach is only fetched once
+        self.futures = {}
+        self.fetched = 0
+
+    # Returns the edges of every node in node_ids, only fetching the ones no one has asked for yet
+    async def edges_many(self, node_ids):
+        new_ids = [node_id for node_id in node_ids if node_id not in self.futures]
+        if len(new_ids) > 0:
+            loop = asyncio.get_running_loop()
+            for node_id in new_ids:
+                self.futures[node_id] = loop.create_future()
+            try:
+                found = self.cache.get_many(new_ids, self.minimum_weight)
+                missing = [node_id for node_id in new_ids if node_id not in found]
+                if len(missing) > 0:
+                    async with self.semaphore:
+                        fetched = await self.fetch_edges_many(missing, self.minimum_weight)
+                    self.cache.put_many(fetched, self.minimum_weight)
+                    self.fetched = self.fetched + len(fetched)
+                    found.update(fetched)
+            except Exception as error:
+                # The tails waiting on these nodes get the error too, instead of waiting forever
+                for node_id in new_ids:
+                    self.futures[node_id].set_exception(error)
+                raise
+            for node_id in new_ids:
+                self.futures[node_id].set_result(found[node_id])
+        return {node_id : await self.futures[node_id] for node_id in node_ids}
+
+    # Goes out the tail of one keyword, expanding every node it reaches up to max_depth edges out. This reaches at
+    #    least every node traversal.fetch_tail_edges() would fetch, it does not skip the edges that are already used.
+    async def walk(self, keyword_id, max_depth):
+        frontier = [keyword_id]
+        expanded_nodes = set()
+        for depth in range(max_depth):
+            frontier_edges = await self.edges_many(frontier)
+            expanded_nodes.update(frontier)
+            next_frontier = {}
+            for node_id in frontier_edges:
+                for edge in frontier_edges[node_id]:
+                    other_id = edge[4] if node_id == edge[3] else edge[3]
+                    if other_id not in expanded_nodes:
+                        next_frontier[other_id] = None
+            frontier = list(next_frontier)
+            if len(frontier) == 0:
+                break
+
+    # Walks every (keyword_id, max_depth) in tails with max_walkers workers taking them off of a queue.
+    async def walk_all(self, tails, max_walkers):
+        queue = asyncio.Queue()
+        for tail in tails:
+            queue.put_nowait(tail)
+
+        async def worker():
+            while not queue.empty():
+                keyword_id, max_depth = queue.get_nowait()
+                await self.walk(keyword_id, max_depth)
+
+        await asyncio.gather(*[worker() for i in range(min(max_walkers, len(tails)))])
+
+### Functions ######################################################################################################################
+
+# Fetches the tails of many keywords at once into the graph's edge cache, so walking them afterwards does not wait
+#    on the database.
+# Input: graph = the graph_access.CachedGraph the script uses, it has to be on Postgres with an edge cache
+#        tails = list of (keyword node id, how many edges out to go)
+#        minimum_weight = the minimum_weight the script uses
+# Output: None
+def prefetch_tails(graph, tails, minimum_weight):
+    # The async client reads the edges table, so its edges would not match the ones of an AdjacencyGraph
+    if graph.cache is None or type(graph.backend) is not graph_access.PostgresGraph:
+        print("Prefetching needs the edges table of the database and the edge cache, skipping it.")
+        return
+
+    async def run():
+        client = AsyncPostgresGraph(graph_access.connection_string, pool_size)
+        await client.open()
+        prefetcher = TailPrefetcher(client.neighbors_many, graph.cache, minimum_weight, pool_size)
+        try:
+            await prefetcher.walk_all(tails, max_walkers)
+        finally:
+            await client.close()
+        return prefetcher, client
+
+    prefetcher, client = asyncio.run(run())
+    print("Prefetched", prefetcher.fetched, "neighbourhoods with", client.queries, "queries over", pool_size, "connections.")
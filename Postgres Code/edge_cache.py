@@ -0,0 +1,130 @@
+# This file holds a persistent on-disk cache of the edges query results, so the ConceptNet neighbourhoods only
+#    have to be fetched from Postgres once and can be reused by every fold and by both
+#    'Categorical Distribution Creation.py' and 'Dynamic CD Update v2.py'.
+#
+# The cache is a SQLite file. Every entry is the full list of edges of one node id above one minimum_weight,
+#    so the key is (node_id, minimum_weight). When the cache has more than max_entries entries the least
+#    recently used ones are thrown away. The hits only update last_used in memory, they are written to the file
+#    with the next put_many() (before it evicts) or on close(), so a lookup that is all hits does not write at all.
+#
+# Sources:
+#    https://docs.python.org/3/library/sqlite3.html
+
+import pickle
+import sqlite3
+
+### Variable Setup #################################################################################################################
+
+# Table setup, the edges column holds the pickled list of edge tuples for the node
+create_table_string = "CREATE TABLE IF NOT EXISTS edge_cache (node_id INTEGER NOT NULL, minimum_weight REAL NOT NULL, edges BLOB NOT NULL, last_used INTEGER NOT NULL, PRIMARY KEY (node_id, minimum_weight));"
+create_index_string = "CREATE INDEX IF NOT EXISTS edge_cache_last_used ON edge_cache (last_used);"
+
+# SQLite only allows so many parameters in one statement, so the lookups are done in chunks of this size
+chunk_size = 500
+
+### Classes ########################################################################################################################
+
+class EdgeCache:
+    # Opens (or creates) the cache file.
+    # Input: path = the filename of the SQLite file, something like "edge_cache.sqlite"
+    #        max_entries = the most (node_id, minimum_weight) entries to keep before evicting, None for no limit
+    def __init__(self, path, max_entries=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # The timeout lets several fold processes share the file, they wait on each other's writes
+        self.conn = sqlite3.connect(path, timeout=60)
+        # Write-ahead logging lets the other folds keep reading while one of them writes
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute(create_table_string)
+        self.conn.execute(create_index_string)
+        self.conn.commit()
+        # last_used is a counter instead of a timestamp so it is always increasing
+        row = self.conn.execute("SELECT MAX(last_used), COUNT(*) FROM edge_cache;").fetchone()
+        self.clock = row[0] if row[0] is not None else 0
+        # The number of entries, counted once here and then kept up to date by put_many() and evict(). Entries
+        #    other fold processes add to the same file are not in it until the cache is opened again.
+        self.size = row[1]
+        # {(node_id, minimum_weight) : last_used} of the hits that are not written to the file yet
+        self.touched = {}
+
+    # Returns the cached edges for every node id in node_ids that is in the cache.
+    # Input: node_ids = list of node ids
+    #        minimum_weight = the minimum_weight the edges were queried with
+    # Return: Dictionary of {node_id : [edges]} for the node ids that were found, the missing ones are left out
+    def get_many(self, node_ids, minimum_weight):
+        found = {}
+        for start in range(0, len(node_ids), chunk_size):
+            chunk = node_ids[start:start + chunk_size]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute("SELECT node_id, edges FROM edge_cache WHERE minimum_weight = ? AND node_id IN (" + placeholders + ");", [minimum_weight] + list(chunk))
+            for node_id, edges in rows:
+                found[node_id] = pickle.loads(edges)
+        self.hits = self.hits + len(found)
+        self.misses = self.misses + len(node_ids) - len(found)
+        if len(found) > 0:
+            self.clock = self.clock + 1
+            for node_id in found:
+                self.touched[(node_id, minimum_weight)] = self.clock
+        return found
+
+    # Writes the last_used of the hits since the last flush to the file, the caller commits.
+    def flush(self):
+        if len(self.touched) == 0:
+            return
+        self.conn.executemany("UPDATE edge_cache SET last_used = ? WHERE node_id = ? AND minimum_weight = ?;", [(last_used, node_id, minimum_weight) for (node_id, minimum_weight), last_used in self.touched.items()])
+        self.touched.clear()
+
+    # Adds the edges of every node in grouped_edges to the cache, then evicts if the cache is too big.
+    # Input: grouped_edges = Dictionary of {node_id : [edges]}, same as query_edges_many returns
+    #        minimum_weight = the minimum_weight the edges were queried with
+    def put_many(self, grouped_edges, minimum_weight):
+        if len(grouped_edges) == 0:
+            return
+        self.clock = self.clock + 1
+        rows = [(node_id, minimum_weight, pickle.dumps(grouped_edges[node_id], pickle.HIGHEST_PROTOCOL), self.clock) for node_id in grouped_edges]
+        # An entry another fold process already added is left as it is, only its last_used is updated
+        cur = self.conn.executemany("INSERT OR IGNORE INTO edge_cache VALUES (?, ?, ?, ?);", rows)
+        self.size = self.size + cur.rowcount
+        if cur.rowcount < len(rows):
+            for node_id in grouped_edges:
+                self.touched[(node_id, minimum_weight)] = self.clock
+        self.flush()
+        self.evict()
+        self.conn.commit()
+
+    # Throws away the least recently used entries until there are at most max_entries left.
+    def evict(self):
+        if self.max_entries is None:
+            return
+        if self.size > self.max_entries:
+            cur = self.conn.execute("DELETE FROM edge_cache WHERE rowid IN (SELECT rowid FROM edge_cache ORDER BY last_used LIMIT ?);", (self.size - self.max_entries,))
+            self.size = self.size - cur.rowcount
+
+    # The same as query_edges_many in the scripts, but only the node ids that are not in the cache are given
+    #    to fetch_edges_many (which should query the database), and its results are added to the cache.
+    # Input: node_ids = an iterable of node ids
+    #        minimum_weight = the minimum_weight for the edges
+    #        fetch_edges_many = function that takes a list of node ids and returns a dictionary of {node_id : [edges]}
+    # Return: Dictionary of {node_id : [edges]} for every node id in node_ids, in the order of node_ids
+    def query_edges_many(self, node_ids, minimum_weight, fetch_edges_many):
+        node_ids = list(dict.fromkeys(node_ids))
+        found = self.get_many(node_ids, minimum_weight)
+        missing = [node_id for node_id in node_ids if node_id not in found]
+        if len(missing) > 0:
+            fetched = fetch_edges_many(missing)
+            self.put_many(fetched, minimum_weight)
+            found.update(fetched)
+        return {node_id : found[node_id] for node_id in node_ids}
+
+    # Returns a string of the hit/miss counters, useful for terminal output.
+    def stats_string(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total > 0 else 0
+        return "Edge cache hits: " + str(self.hits) + ", misses: " + str(self.misses) + ", hit rate: " + str(round(hit_rate, 4))
+
+    def close(self):
+        self.flush()
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,120 @@
+# This file runs the K-fold trials for 'RunTrial.py' and 'RunUpdate.py'. The folds do not depend on each other,
+#    so they are run at the same time with a pool of workers. Each fold's creation and update run one after the
+#    other in the same worker, so a fold's update starts as soon as its own creation is done. Every stage is its
+#    own python process, so every worker has its own database connection.
+#
+# The output of every stage is written to a log file next to its signature, and the exit status, time and accuracy
+#    of every stage are collected into one summary at the end.
+#
+# Sources:
+# https://docs.python.org/3/library/concurrent.futures.html
+# https://docs.python.org/3/library/subprocess.html
+
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+### Variable Setup #################################################################################################################
+
+creation_script = "Categorical Distribution Creation.py"
+shared_creation_script = "kfold_signatures.py"
+update_script = "Dynamic CD Update v2.py"
+
+# Used to grab the accuracy scores out of the output of the update script
+initial_accuracy_pattern = re.compile(r"The initial accuracy score for this model is: ([0-9.eE+-]+)")
+updated_accuracy_pattern = re.compile(r"The updated accuracy score for this model is: ([0-9.eE+-]+)")
+
+### Functions ######################################################################################################################
+
+# Returns the command line arguements for each stage of a fold, the same files RunTrial.py always used except the
+#    signatures are saved as .npz files (see signature_store.py).
+def creation_args(fold):
+    return [creation_script, "training_set_" + str(fold) + "_keywords.csv", "class_words_" + str(fold) + ".npz"]
+
+def shared_creation_args(num_folds, contributions_file=None):
+    args = [shared_creation_script, str(num_folds)]
+    if contributions_file is not None:
+        args.append(contributions_file)
+    return args
+
+def update_args(fold):
+    return [update_script, "class_words_" + str(fold) + ".npz", "test_set_" + str(fold) + "_keywords.csv", "extended_class_words_" + str(fold) + ".npz"]
+
+# Runs one stage as its own python process and writes its output to log_file.
+# Input: args = the script and its command line arguements
+#        log_file = the filename to write the output of the stage to
+# Return: dictionary of the exit status, the number of seconds it took and the output
+def run_stage(args, log_file):
+    start_time = time.perf_counter()
+    completed = subprocess.run([sys.executable] + args, shell = False, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, text = True)
+    seconds = time.perf_counter() - start_time
+    with open(log_file, "w") as f:
+        f.write(completed.stdout)
+    return {"status" : completed.returncode, "seconds" : seconds, "output" : completed.stdout}
+
+# Runs the stages of one fold in order. If a stage fails the stages after it are skipped.
+# Input: fold = the fold number
+#        run_creation, run_update = which stages to run
+# Return: dictionary of the results of the fold, used by print_summary()
+def run_fold(fold, run_creation=True, run_update=True):
+    result = {"fold" : fold, "creation" : None, "update" : None, "initial_accuracy" : None, "updated_accuracy" : None}
+    if run_creation:
+        print("Fold", fold, ": starting the Categorical Distribution Creation.")
+        result["creation"] = run_stage(creation_args(fold), "class_words_" + str(fold) + ".log")
+        print("Fold", fold, ": creation finished with exit status", result["creation"]["status"], "in", round(result["creation"]["seconds"], 1), "seconds.")
+        if result["creation"]["status"] != 0:
+            return result
+    if run_update:
+        print("Fold", fold, ": starting the Dynamic Categorical Distribution Update.")
+        result["update"] = run_stage(update_args(fold), "extended_class_words_" + str(fold) + ".log")
+        print("Fold", fold, ": update finished with exit status", result["update"]["status"], "in", round(result["update"]["seconds"], 1), "seconds.")
+        initial_match = initial_accuracy_pattern.search(result["update"]["output"])
+        updated_match = updated_accuracy_pattern.search(result["update"]["output"])
+        if initial_match is not None:
+            result["initial_accuracy"] = float(initial_match.group(1))
+        if updated_match is not None:
+            result["updated_accuracy"] = float(updated_match.group(1))
+    return result
+
+# Runs every fold with a pool of worker_count workers.
+# Input: folds = iterable of the fold numbers
+#        worker_count = how many folds to run at the same time
+#        run_creation, run_update = which stages to run
+# Return: list of the results of every fold, in the order of folds
+def run_folds(folds, worker_count, run_creation=True, run_update=True):
+    with ThreadPoolExecutor(max_workers = worker_count) as pool:
+        futures = [pool.submit(run_fold, fold, run_creation, run_update) for fold in folds]
+        return [future.result() for future in futures]
+
+# Makes the signatures of every fold at once with kfold_signatures.py, which walks every row only once.
+# Input: num_folds = the number of folds
+#        contributions_file = where kfold_signatures.py keeps the walked rows, or None to not keep them
+# Return: dictionary of the exit status, the number of seconds it took and the output
+def run_shared_creation(num_folds, contributions_file=None):
+    print("Starting the shared Categorical Distribution Creation of all", num_folds, "folds.")
+    result = run_stage(shared_creation_args(num_folds, contributions_file), "class_words_all_folds.log")
+    print("Shared creation finished with exit status", result["status"], "in", round(result["seconds"], 1), "seconds.")
+    return result
+
+# Prints a table of the exit status, time and accuracy of every fold, and the average accuracy.
+def print_summary(results, wall_seconds=None):
+    print("Fold summary:")
+    print("fold | creation status | creation seconds | update status | update seconds | initial accuracy | updated accuracy")
+    for result in results:
+        row = [str(result["fold"])]
+        for stage in ["creation", "update"]:
+            if result[stage] is None:
+                row = row + ["-", "-"]
+            else:
+                row = row + [str(result[stage]["status"]), str(round(result[stage]["seconds"], 1))]
+        for accuracy in ["initial_accuracy", "updated_accuracy"]:
+            row.append("-" if result[accuracy] is None else str(round(result[accuracy], 4)))
+        print(" | ".join(row))
+    for accuracy in ["initial_accuracy", "updated_accuracy"]:
+        scores = [result[accuracy] for result in results if result[accuracy] is not None]
+        if len(scores) > 0:
+            print("Average", accuracy.replace("_", " "), "over", len(scores), "folds:", round(sum(scores) / len(scores), 4))
+    if wall_seconds is not None:
+        print("Total wall-clock time:", round(wall_seconds, 1), "seconds.")
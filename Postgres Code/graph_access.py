@@ -0,0 +1,576 @@
+# This file is the one place the scripts get at ConceptNet through. Every graph store is a backend with the
+#    same four methods, so the store can be swapped without touching the scripts:
+#    - resolve(word) / resolve_many(words): the (id, uri) rows of the '/c/en/<word>' nodes
+#    - neighbors(node_id, minimum_weight) / neighbors_many(node_ids, minimum_weight): the edges of the nodes
+#      with a weight above minimum_weight, as (id, uri, relation_id, start_id, end_id, weight) tuples
+#
+# The backends are:
+#    - PostgresGraph: the conceptnet5 database
+#    - AdjacencyGraph: the english adjacency table made in the conceptnet5 database by build-adjacency below
+#    - local_graph.LocalGraph: a memory-mapped subgraph made by 'local_graph.py', no database needed
+#    - InMemoryGraph: a small graph made from python lists, for tests
+# CachedGraph wraps any of them with the node resolver and the on-disk edge cache.
+#
+# To compare how fast the stores are on a keywords file:
+#    python3 graph_access.py benchmark training_set_0_keywords.csv [local subgraph folder]
+#
+# PostgresGraph uses server-side prepared statements, so the queries are only planned once per connection. The
+#    edges query has the minimum_weight written into it (one prepared statement per minimum_weight), so the
+#    planner can use the partial indexes below with the one plan it keeps. To make the indexes the queries need
+#    and to check the plans Postgres picks for them:
+#    python3 graph_access.py setup-indexes 4
+#    python3 graph_access.py verify-indexes 4 [sample word]
+#
+# The edges table holds every language, so each edges query has to pick the english edges above the minimum_weight
+#    out of all of them by start_id or end_id. build-adjacency makes a table that only holds those edges, once for
+#    each direction, as (node_id, neighbor_id, edge_id, uri, relation_id, start_id, end_id, weight) rows indexed on
+#    node_id:
+#    python3 graph_access.py build-adjacency 4
+# With adjacency_table_weight set to 4, the edges of a node are then one lookup of node_id, and every row still
+#    holds the whole edge, so the walk gets the same edge tuples as from the edges table. Like local_graph.py, only
+#    the edges between two english nodes are kept.
+#
+# Any backend can fetch the edges of the tails of a whole batch of keywords at once (tails_many below), with one
+#    query per depth level for the whole batch instead of one for every keyword. AdjacencyGraph does it with one
+#    WITH RECURSIVE query for the whole batch instead (see adjacency_tails_select_string). traversal.TailMemo then
+#    walks each tail over them the same way as the tails it fetches itself, so the counts of a row come out the
+#    same. To check the query against traversal.fetch_tail_edges() on a database:
+#    python3 graph_access.py check-tails training_set_0_keywords.csv 2
+#
+# Sources:
+#    https://www.psycopg.org/docs/usage.html#passing-parameters-to-sql-queries
+#    https://www.postgresql.org/docs/current/sql-prepare.html
+#    https://www.postgresql.org/docs/current/indexes-partial.html
+#    https://www.postgresql.org/docs/current/indexes-opclass.html
+#    https://www.postgresql.org/docs/current/sql-createtableas.html
+#    https://www.postgresql.org/docs/current/sql-cluster.html
+#    https://www.postgresql.org/docs/current/queries-with.html#QUERIES-WITH-RECURSIVE
+
+import sys
+import time
+import edge_cache
+import node_resolver
+import traversal
+
+### Variable Setup #################################################################################################################
+
+# Used to connect to the database
+connection_string = "dbname=conceptnet5 user=postgres host=localhost"
+
+# The uris of the english nodes look like '/c/en/<word>'
+english_uri_start = "/c/en/"
+
+# Nodes table query for a whole list of exact uris at once, the %s is filled in by psycopg2 with the list
+nodes_many_select_string = "SELECT id,uri FROM nodes WHERE uri = ANY(%s);"
+
+# Edges table query for a whole set of node ids at once, the %s are filled in by psycopg2 with the parameters
+edges_many_select_string = "SELECT id,uri,relation_id,start_id,end_id,weight FROM edges WHERE (start_id = ANY(%s) OR end_id = ANY(%s)) AND weight > %s ORDER BY id;"
+
+# Use server-side prepared statements for the queries, set to False to send the plain queries every time
+use_prepared_statements = True
+
+# The prepared versions of the queries. The {weight} is filled in with the minimum_weight written as a literal.
+nodes_many_prepare_string = "PREPARE nodes_many (text[]) AS SELECT id,uri FROM nodes WHERE uri = ANY($1);"
+nodes_many_execute_string = "EXECUTE nodes_many (%s);"
+edges_many_prepare_string = "PREPARE edges_many_{name} (bigint[]) AS SELECT id,uri,relation_id,start_id,end_id,weight FROM edges WHERE (start_id = ANY($1) OR end_id = ANY($1)) AND weight > {weight} ORDER BY id;"
+edges_many_execute_string = "EXECUTE edges_many_{name} (%s);"
+
+# The indexes the queries need. The edges indexes are partial, they only hold the edges above the minimum_weight,
+#    and text_pattern_ops lets the nodes index be used for the LIKE '/c/en/%' prefix queries too.
+nodes_index_string = "CREATE INDEX IF NOT EXISTS nodes_uri_pattern_idx ON nodes (uri text_pattern_ops);"
+edges_start_index_string = "CREATE INDEX IF NOT EXISTS edges_start_id_weight_{name}_idx ON edges (start_id) WHERE weight > {weight};"
+edges_end_index_string = "CREATE INDEX IF NOT EXISTS edges_end_id_weight_{name}_idx ON edges (end_id) WHERE weight > {weight};"
+
+# The english adjacency table, see build_adjacency(). Set adjacency_table_weight to the minimum_weight a table was
+#    built with to read the edges out of it instead of out of the edges table, or None to use the edges table.
+#    Its edges are cached in their own file, since they leave out the non english neighbours the edges table has.
+#    The table has to be made again with build-adjacency if it was made before its rows held the whole edge, and
+#    the old "adjacency_cache.sqlite" of those rows is not read any more.
+adjacency_table_weight = None
+adjacency_edge_cache_file = "english_adjacency_cache.sqlite"
+
+# Makes the adjacency table out of the edges table, every edge between two english nodes is in it once from each
+#    end (self loops only once). The {name} and {weight} are filled in the same way as the prepared statements.
+adjacency_create_string = "CREATE TABLE english_adjacency_{name} AS " \
+    + "SELECT e.start_id AS node_id, e.end_id AS neighbor_id, e.id AS edge_id, e.uri AS uri, e.relation_id AS relation_id, e.start_id AS start_id, e.end_id AS end_id, e.weight AS weight FROM edges e JOIN nodes s ON s.id = e.start_id JOIN nodes t ON t.id = e.end_id WHERE e.weight > {weight} AND s.uri LIKE '/c/en/%' AND t.uri LIKE '/c/en/%' " \
+    + "UNION ALL " \
+    + "SELECT e.end_id, e.start_id, e.id, e.uri, e.relation_id, e.start_id, e.end_id, e.weight FROM edges e JOIN nodes s ON s.id = e.start_id JOIN nodes t ON t.id = e.end_id WHERE e.weight > {weight} AND s.uri LIKE '/c/en/%' AND t.uri LIKE '/c/en/%' AND e.start_id <> e.end_id;"
+adjacency_drop_string = "DROP TABLE IF EXISTS english_adjacency_{name};"
+# The table is clustered on the index, so the rows of a node are next to each other on disk
+adjacency_index_string = "CREATE INDEX english_adjacency_{name}_node_idx ON english_adjacency_{name} (node_id, edge_id);"
+adjacency_cluster_string = "CLUSTER english_adjacency_{name} USING english_adjacency_{name}_node_idx;"
+
+# Adjacency table query for a whole set of node ids at once. The weight is checked again so a table can answer
+#    queries for a higher minimum_weight than it was built with.
+adjacency_many_select_string = "SELECT node_id,edge_id,uri,relation_id,start_id,end_id,weight FROM english_adjacency_{name} WHERE node_id = ANY(%s) AND weight > %s ORDER BY node_id, edge_id;"
+adjacency_many_prepare_string = "PREPARE adjacency_many_{name} (bigint[], double precision) AS SELECT node_id,edge_id,uri,relation_id,start_id,end_id,weight FROM english_adjacency_{name} WHERE node_id = ANY($1) AND weight > $2 ORDER BY node_id, edge_id;"
+adjacency_many_execute_string = "EXECUTE adjacency_many_{name} (%s, %s);"
+
+# The edges of the tails of a batch of keywords, out to max_depth edges, in one query on the adjacency table. walk
+#    finds every node fewer than max_depth edges from each root (the nodes fetch_tail_edges() fetches the edges
+#    of). It is a UNION, so each (root, node, depth) is only walked on from once, and a node that many paths reach
+#    is at most in it once for each depth, not once for each path. The query gives two kinds of rows:
+#    - the edges of every one of those nodes, once for each node no matter how many roots reached it, with a NULL
+#      root and ordered the same way as adjacency_many_select_string
+#    - a thin (root, node_id) row for each node each root reached, with NULLs for the edge
+#    The %s are the root node ids, max_depth, and minimum_weight twice.
+adjacency_tails_select_string = "WITH RECURSIVE walk (root, node_id, depth) AS (" \
+    + "SELECT r, r, 0 FROM unnest(%s::bigint[]) AS r " \
+    + "UNION " \
+    + "SELECT w.root, a.neighbor_id, w.depth + 1 FROM walk w JOIN english_adjacency_{name} a ON a.node_id = w.node_id WHERE w.depth + 1 < %s AND a.weight > %s" \
+    + "), members AS (SELECT DISTINCT root, node_id FROM walk) " \
+    + "SELECT NULL::bigint AS root, a.node_id, a.edge_id, a.uri, a.relation_id, a.start_id, a.end_id, a.weight FROM english_adjacency_{name} a WHERE a.node_id IN (SELECT node_id FROM members) AND a.weight > %s " \
+    + "UNION ALL " \
+    + "SELECT root, node_id, NULL, NULL, NULL, NULL, NULL, NULL FROM members " \
+    + "ORDER BY 1 NULLS FIRST, 2, 3;"
+
+# The most keywords fetched with one tails_many() batch
+recursive_batch_size = 200
+
+# The on-disk cache of the edges queries. It is shared by every fold and by both scripts, so a neighbourhood is only
+#    fetched from the database once. Set edge_cache_file to None to always query the database.
+edge_cache_file = "edge_cache.sqlite"
+edge_cache_max_entries = 5000000 # Least recently used entries are thrown out past this many nodes
+
+# The most words the node resolver remembers the node ids of, the least recently used words are forgotten past this
+node_resolver_max_size = 100000
+
+### Functions ######################################################################################################################
+
+# Returns (name, literal) for a minimum_weight, the literal is how it is written into the prepared statements and
+#    the partial indexes (the same text in both, so Postgres can tell the index covers the query), and the name is
+#    the literal with only characters that can go in a statement or index name.
+def weight_literal(minimum_weight):
+    if float(minimum_weight) == int(minimum_weight):
+        literal = str(int(minimum_weight))
+    else:
+        literal = repr(float(minimum_weight))
+    return literal.replace("-", "minus_").replace(".", "_"), literal
+
+# Groups a list of edge tuples by node, the same way for every backend.
+# Input: node_ids = list of node ids, with no repeats
+#        edge_results = list of edge tuples, each one touches at least one of the node ids
+# Return: Dictionary of {node_id : [edges]}, every node id in node_ids gets a (possibly empty) list.
+#    An edge between two of the input nodes is in both of their lists.
+def group_edges(node_ids, edge_results):
+    grouped_edges = {node_id : [] for node_id in node_ids}
+    for edge in edge_results:
+        if edge[3] in grouped_edges:
+            grouped_edges[edge[3]].append(edge)
+        # Self loops only need to be added once
+        if edge[4] in grouped_edges and edge[4] != edge[3]:
+            grouped_edges[edge[4]].append(edge)
+    return grouped_edges
+
+# Opens the graph the scripts use. This is the only thing the scripts need to call.
+# Input: local_graph_folder = the folder of a subgraph made by 'local_graph.py', or None to use the database
+# Return: a CachedGraph around the backend
+def open_graph(local_graph_folder=None):
+    if local_graph_folder is None and adjacency_table_weight is not None:
+        print("Connecting to the Database...")
+        backend = AdjacencyGraph(connection_string, adjacency_table_weight, use_prepared_statements)
+        print("Connection established, reading the edges out of english_adjacency_" + backend.name + ".")
+        cache_file = adjacency_edge_cache_file
+    elif local_graph_folder is None:
+        print("Connecting to the Database...")
+        backend = PostgresGraph(connection_string, use_prepared_statements)
+        print("Connection established.")
+        cache_file = edge_cache_file
+    else:
+        import local_graph
+        print("Loading the local subgraph in", local_graph_folder)
+        backend = local_graph.LocalGraph(local_graph_folder)
+        # The memory-mapped subgraph is already faster to read than the edge cache would be
+        cache_file = None
+    return CachedGraph(backend, cache_file, edge_cache_max_entries, node_resolver_max_size)
+
+### Classes ########################################################################################################################
+
+# The backend interface. A backend only has to write resolve_many and neighbors_many, the single versions
+#    are done with them.
+class GraphBackend:
+    # Input: words = an iterable of words
+    # Return: Dictionary of {word : [(id, uri)]}, the list is empty if the word is not in ConceptNet
+    def resolve_many(self, words):
+        raise NotImplementedError
+
+    # Input: node_ids = an iterable of node ids
+    #        minimum_weight = only edges with a weight above this are returned
+    # Return: Dictionary of {node_id : [edges]} in the order of node_ids, the edges of each node are ordered by edge id
+    def neighbors_many(self, node_ids, minimum_weight):
+        raise NotImplementedError
+
+    # Fetches the edges of the tails of many keywords, recursive_batch_size keywords to a batch, with one
+    #    neighbors_many call per depth level for each batch.
+    # Input: keyword_ids = an iterable of the node ids of the keywords
+    #        max_depth = how many edges out to go, this is the tail_length
+    #        minimum_weight = same as for neighbors_many
+    # Return: Dictionary of {keyword_id : neighbourhoods}, see traversal.fetch_tail_edges_many()
+    def tails_many(self, keyword_ids, max_depth, minimum_weight):
+        keyword_ids = list(dict.fromkeys(keyword_ids))
+        tails = {}
+        for start in range(0, len(keyword_ids), recursive_batch_size):
+            tails.update(traversal.fetch_tail_edges_many(keyword_ids[start:start + recursive_batch_size], lambda node_ids: self.neighbors_many(node_ids, minimum_weight), max_depth))
+        return tails
+
+    def resolve(self, word):
+        return self.resolve_many([word])[word]
+
+    def neighbors(self, node_id, minimum_weight):
+        return self.neighbors_many([node_id], minimum_weight)[node_id]
+
+    def stats_string(self):
+        return ""
+
+    def close(self):
+        pass
+
+class PostgresGraph(GraphBackend):
+    # Input: connection_string = the psycopg2 connection string
+    #        prepared = True to use server-side prepared statements
+    def __init__(self, connection_string, prepared=True):
+        import psycopg2
+        self.conn = psycopg2.connect(connection_string)
+        self.queries = 0
+        self.prepared = prepared
+        # The prepared statements made on this connection so far
+        self.statements = set()
+
+    # Makes the prepared statement on this connection if it has not been made yet.
+    def prepare(self, name, prepare_string):
+        if name not in self.statements:
+            cur = self.conn.cursor()
+            cur.execute(prepare_string)
+            cur.close()
+            self.statements.add(name)
+
+    def resolve_many(self, words):
+        words = list(dict.fromkeys(words))
+        if len(words) == 0:
+            return {}
+        cur = self.conn.cursor()
+        if self.prepared:
+            self.prepare("nodes_many", nodes_many_prepare_string)
+            cur.execute(nodes_many_execute_string, ([english_uri_start + word for word in words],))
+        else:
+            cur.execute(nodes_many_select_string, ([english_uri_start + word for word in words],))
+        node_results = cur.fetchall()
+        cur.close()
+        self.queries = self.queries + 1
+        resolved = {word : [] for word in words}
+        for node in node_results:
+            resolved[node[1][len(english_uri_start):]].append(node)
+        return resolved
+
+    def neighbors_many(self, node_ids, minimum_weight):
+        node_ids = list(dict.fromkeys(node_ids))
+        if len(node_ids) == 0:
+            return {}
+        cur = self.conn.cursor()
+        if self.prepared:
+            name, literal = weight_literal(minimum_weight)
+            self.prepare("edges_many_" + name, edges_many_prepare_string.format(name=name, weight=literal))
+            cur.execute(edges_many_execute_string.format(name=name), (node_ids,))
+        else:
+            cur.execute(edges_many_select_string, (node_ids, node_ids, minimum_weight))
+        edge_results = cur.fetchall()
+        cur.close()
+        self.queries = self.queries + 1
+        return group_edges(node_ids, edge_results)
+
+    def stats_string(self):
+        return "Database queries: " + str(self.queries)
+
+    def close(self):
+        self.conn.close()
+        print("Connection closed.")
+
+# Reads the edges out of an english adjacency table made by build_adjacency(), the nodes are still looked up in
+#    the nodes table. The edges are the same (id, uri, relation_id, start_id, end_id, weight) tuples as the edges
+#    table gives.
+class AdjacencyGraph(PostgresGraph):
+    # Input: connection_string = the psycopg2 connection string
+    #        table_weight = the minimum_weight the table was built with
+    #        prepared = True to use server-side prepared statements
+    def __init__(self, connection_string, table_weight, prepared=True):
+        PostgresGraph.__init__(self, connection_string, prepared)
+        self.table_weight = table_weight
+        self.name = weight_literal(table_weight)[0]
+
+    # Input: node_ids = an iterable of ConceptNet node ids
+    #        minimum_weight = only edges above this weight are returned, this can not be lower than the
+    #            minimum_weight the table was built with
+    # Return: Dictionary of {node_id : [edges]}
+    def neighbors_many(self, node_ids, minimum_weight):
+        if minimum_weight < self.table_weight:
+            raise ValueError("english_adjacency_" + self.name + " was built with a minimum_weight of " + str(self.table_weight) + ", it can not answer queries for " + str(minimum_weight))
+        node_ids = list(dict.fromkeys(node_ids))
+        if len(node_ids) == 0:
+            return {}
+        cur = self.conn.cursor()
+        if self.prepared:
+            self.prepare("adjacency_many_" + self.name, adjacency_many_prepare_string.format(name=self.name))
+            cur.execute(adjacency_many_execute_string.format(name=self.name), (node_ids, minimum_weight))
+        else:
+            cur.execute(adjacency_many_select_string.format(name=self.name), (node_ids, minimum_weight))
+        adjacency_results = cur.fetchall()
+        cur.close()
+        self.queries = self.queries + 1
+        grouped_edges = {node_id : [] for node_id in node_ids}
+        for adjacency_result in adjacency_results:
+            grouped_edges[adjacency_result[0]].append(adjacency_result[1:])
+        return grouped_edges
+
+    # Fetches the edges of the tails of many keywords with one adjacency_tails_select_string query for every
+    #    recursive_batch_size keywords.
+    # Input: keyword_ids = an iterable of the node ids of the keywords
+    #        max_depth = how many edges out to go, this is the tail_length
+    #        minimum_weight = same as for neighbors_many
+    # Return: Dictionary of {keyword_id : neighbourhoods}, same as GraphBackend.tails_many()
+    def tails_many(self, keyword_ids, max_depth, minimum_weight):
+        if minimum_weight < self.table_weight:
+            raise ValueError("english_adjacency_" + self.name + " was built with a minimum_weight of " + str(self.table_weight) + ", it can not answer queries for " + str(minimum_weight))
+        keyword_ids = list(dict.fromkeys(keyword_ids))
+        tails = {}
+        for start in range(0, len(keyword_ids), recursive_batch_size):
+            batch = keyword_ids[start:start + recursive_batch_size]
+            cur = self.conn.cursor()
+            cur.execute(adjacency_tails_select_string.format(name=self.name), (batch, max_depth, minimum_weight, minimum_weight))
+            tail_results = cur.fetchall()
+            cur.close()
+            self.queries = self.queries + 1
+            # The edge rows come first, then each root gets the same edge list of every node it reached
+            grouped_edges = {}
+            neighbourhoods = {keyword_id : {} for keyword_id in batch}
+            for tail_result in tail_results:
+                if tail_result[0] is None:
+                    grouped_edges.setdefault(tail_result[1], []).append(tail_result[2:])
+                else:
+                    neighbourhoods[tail_result[0]][tail_result[1]] = grouped_edges.get(tail_result[1], [])
+            tails.update(neighbourhoods)
+        return tails
+
+class InMemoryGraph(GraphBackend):
+    # Input: nodes = list of (id, uri) tuples
+    #        edges = list of (id, uri, relation_id, start_id, end_id, weight) tuples
+    def __init__(self, nodes, edges):
+        self.nodes_by_uri = {}
+        for node in nodes:
+            self.nodes_by_uri.setdefault(node[1], []).append(tuple(node))
+        self.edges_by_node = {}
+        for edge in sorted(edges):
+            self.edges_by_node.setdefault(edge[3], []).append(tuple(edge))
+            if edge[4] != edge[3]:
+                self.edges_by_node.setdefault(edge[4], []).append(tuple(edge))
+
+    def resolve_many(self, words):
+        return {word : list(self.nodes_by_uri.get(english_uri_start + word, [])) for word in dict.fromkeys(words)}
+
+    def neighbors_many(self, node_ids, minimum_weight):
+        return {node_id : [edge for edge in self.edges_by_node.get(node_id, []) if edge[5] > minimum_weight] for node_id in dict.fromkeys(node_ids)}
+
+# Wraps a backend with the node resolver (an LRU of word lookups) and, if cache_file is set, the on-disk edge cache.
+class CachedGraph(GraphBackend):
+    def __init__(self, backend, cache_file=None, cache_max_entries=None, resolver_max_size=100000):
+        self.backend = backend
+        self.resolver = node_resolver.NodeResolver(backend.resolve_many, resolver_max_size)
+        if cache_file is None:
+            self.cache = None
+        else:
+            self.cache = edge_cache.EdgeCache(cache_file, cache_max_entries)
+
+    def resolve_many(self, words):
+        return self.resolver.resolve_many(words)
+
+    def neighbors_many(self, node_ids, minimum_weight):
+        if self.cache is None:
+            return self.backend.neighbors_many(node_ids, minimum_weight)
+        return self.cache.query_edges_many(node_ids, minimum_weight, lambda missing: self.backend.neighbors_many(missing, minimum_weight))
+
+    # A backend with its own tails_many (AdjacencyGraph) fetches the tails itself, and the edges it fetched are put
+    #    in the edge cache, so a tail that is walked again in its row reads them from there. The others go through
+    #    the cache one depth level at a time.
+    def tails_many(self, keyword_ids, max_depth, minimum_weight):
+        if type(self.backend).tails_many is GraphBackend.tails_many:
+            return GraphBackend.tails_many(self, keyword_ids, max_depth, minimum_weight)
+        tails = self.backend.tails_many(keyword_ids, max_depth, minimum_weight)
+        if self.cache is not None:
+            fetched = {}
+            for neighbourhoods in tails.values():
+                fetched.update(neighbourhoods)
+            self.cache.put_many(fetched, minimum_weight)
+        return tails
+
+    def stats_string(self):
+        lines = [self.resolver.stats_string()]
+        if self.cache is not None:
+            lines.append(self.cache.stats_string())
+        if self.backend.stats_string() != "":
+            lines.append(self.backend.stats_string())
+        return "\n".join(lines)
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.close()
+        self.backend.close()
+
+### Benchmark ######################################################################################################################
+
+# Walks the tails of every keyword in a keywords csv with a backend and returns how long it took.
+# Input: backend = any GraphBackend
+#        keywords = list of keyword strings
+#        minimum_weight, tail_length = same as in the scripts
+# Return: the number of seconds it took
+def benchmark_backend(backend, keywords, minimum_weight, tail_length):
+    start_time = time.perf_counter()
+    resolved = backend.resolve_many(keywords)
+    for word in resolved:
+        if len(resolved[word]) == 0:
+            continue
+        neighbourhoods = {}
+        traversal.fetch_tail_edges([resolved[word][0][0]], 0, lambda node_ids: backend.neighbors_many(node_ids, minimum_weight), tail_length, neighbourhoods)
+        traversal.tail_records(resolved[word][0][0], neighbourhoods, tail_length, set())
+    return time.perf_counter() - start_time
+
+# Checks the tails a backend's tails_many() fetches against the ones traversal.fetch_tail_edges() fetches one depth
+#    level at a time, for every keyword: the nodes fetched and their edges, in the same order. The counts are walked
+#    over those, so they come out the same when these are.
+# Input: backend = any GraphBackend
+#        keywords = list of keyword strings
+#        minimum_weight, tail_length = same as in the scripts
+# Return: (the number of keywords whose tails are not the same, the number of keywords checked)
+def check_tails(backend, keywords, minimum_weight, tail_length):
+    resolved = backend.resolve_many(keywords)
+    keyword_ids = list(dict.fromkeys(resolved[word][0][0] for word in resolved if len(resolved[word]) > 0))
+    query_edges_many = lambda node_ids: backend.neighbors_many(node_ids, minimum_weight)
+    start_time = time.perf_counter()
+    batch_tails = backend.tails_many(keyword_ids, tail_length, minimum_weight)
+    print("tails_many took", round(time.perf_counter() - start_time, 3), "seconds.")
+    start_time = time.perf_counter()
+    level_tails = {}
+    for keyword_id in keyword_ids:
+        neighbourhoods = {}
+        reached = {keyword_id}
+        frontier = set(traversal.fetch_tail_edges([keyword_id], 0, query_edges_many, tail_length, neighbourhoods, reached))
+        level_tails[keyword_id] = {node_id : neighbourhoods[node_id] for node_id in reached if node_id not in frontier}
+    print("fetch_tail_edges took", round(time.perf_counter() - start_time, 3), "seconds.")
+    differing = [keyword_id for keyword_id in keyword_ids if batch_tails[keyword_id] != level_tails[keyword_id]]
+    for keyword_id in differing[:10]:
+        print("The tails of node", keyword_id, "are not the same.")
+    return len(differing), len(keyword_ids)
+
+### Index Setup ####################################################################################################################
+
+# Makes the indexes the queries need for the minimum_weight, if they are not already there.
+# Input: conn = an open psycopg2 connection
+#        minimum_weight = the minimum_weight the scripts use
+# Output: None
+def setup_indexes(conn, minimum_weight):
+    name, literal = weight_literal(minimum_weight)
+    cur = conn.cursor()
+    for index_string in [nodes_index_string, edges_start_index_string.format(name=name, weight=literal), edges_end_index_string.format(name=name, weight=literal)]:
+        print(index_string)
+        cur.execute(index_string)
+    conn.commit()
+    cur.execute("ANALYZE nodes;")
+    cur.execute("ANALYZE edges;")
+    conn.commit()
+    cur.close()
+    print("Indexes are set up.")
+
+# Prints the indexes on the nodes and edges tables and the plans of the prepared queries, and warns about any
+#    query that would scan a whole table.
+# Input: conn = an open psycopg2 connection
+#        minimum_weight = the minimum_weight the scripts use
+#        sample_word = a word that is in ConceptNet, its node is used for the edges plan
+# Return: True if none of the plans scan a whole table
+def verify_indexes(conn, minimum_weight, sample_word="dog"):
+    name, literal = weight_literal(minimum_weight)
+    cur = conn.cursor()
+    cur.execute("SELECT tablename, indexname, indexdef FROM pg_indexes WHERE tablename IN ('nodes', 'edges') ORDER BY tablename, indexname;")
+    print("Indexes on nodes and edges:")
+    for row in cur.fetchall():
+        print("   ", row[1], ":", row[2])
+    cur.execute(nodes_many_prepare_string)
+    cur.execute(edges_many_prepare_string.format(name=name, weight=literal))
+    cur.execute(nodes_many_execute_string, ([english_uri_start + sample_word],))
+    node_results = cur.fetchall()
+    node_ids = [node[0] for node in node_results]
+    if len(node_ids) == 0:
+        print("The sample word", sample_word, "is not in ConceptNet, the edges plan is made with no node ids.")
+    all_good = True
+    for title, explain_string, params in [("nodes query", "EXPLAIN " + nodes_many_execute_string, ([english_uri_start + sample_word],)), ("edges query", "EXPLAIN " + edges_many_execute_string.format(name=name), (node_ids,))]:
+        cur.execute(explain_string, params)
+        plan = [row[0] for row in cur.fetchall()]
+        print("Plan of the", title + ":")
+        for line in plan:
+            print("   ", line)
+        if any("Seq Scan" in line for line in plan):
+            all_good = False
+            print("WARNING: the", title, "scans the whole table, run: python3 graph_access.py setup-indexes", literal)
+    cur.execute("DEALLOCATE ALL;")
+    cur.close()
+    return all_good
+
+# Makes the english adjacency table for the minimum_weight, replacing it if it is already there.
+# Input: conn = an open psycopg2 connection
+#        minimum_weight = the minimum_weight the scripts use
+# Output: None
+def build_adjacency(conn, minimum_weight):
+    name, literal = weight_literal(minimum_weight)
+    cur = conn.cursor()
+    for table_string in [adjacency_drop_string, adjacency_create_string, adjacency_index_string, adjacency_cluster_string]:
+        print(table_string.format(name=name, weight=literal))
+        cur.execute(table_string.format(name=name, weight=literal))
+        conn.commit()
+    cur.execute("ANALYZE english_adjacency_" + name + ";")
+    conn.commit()
+    cur.execute("SELECT count(*) FROM english_adjacency_" + name + ";")
+    print("english_adjacency_" + name, "has", cur.fetchall()[0][0], "rows, set adjacency_table_weight =", literal, "to use it.")
+    cur.close()
+
+### Main Code ########################################################################################################################
+
+if __name__ == "__main__":
+    import pandas as pd
+    import local_graph
+    # Grab the command line arguements
+    usage = "Usage: python3 graph_access.py benchmark <keywords csv> [local subgraph folder]\n" \
+        + "       python3 graph_access.py setup-indexes <minimum_weight>\n" \
+        + "       python3 graph_access.py verify-indexes <minimum_weight> [sample word]\n" \
+        + "       python3 graph_access.py build-adjacency <minimum_weight>\n" \
+        + "       python3 graph_access.py check-tails <keywords csv> <tail_length>"
+    if len(sys.argv) < 3 or sys.argv[1] not in ["benchmark", "setup-indexes", "verify-indexes", "build-adjacency", "check-tails"]:
+        sys.exit(usage)
+    if sys.argv[1] == "check-tails":
+        # The tails are checked on the adjacency table, so it has to be built and adjacency_table_weight set
+        if len(sys.argv) < 4 or adjacency_table_weight is None:
+            sys.exit(usage + "\ncheck-tails needs adjacency_table_weight set to the minimum_weight of an adjacency table")
+        backend = AdjacencyGraph(connection_string, adjacency_table_weight, use_prepared_statements)
+        differing, checked = check_tails(backend, " ".join(pd.read_csv(sys.argv[2]).keywords).split(), adjacency_table_weight, int(sys.argv[3]))
+        print(differing, "of the tails of", checked, "keywords are not the same.")
+        backend.close()
+        sys.exit(0 if differing == 0 else 1)
+    if sys.argv[1] == "build-adjacency":
+        import psycopg2
+        conn = psycopg2.connect(connection_string)
+        build_adjacency(conn, float(sys.argv[2]))
+        conn.close()
+        sys.exit(0)
+    if sys.argv[1] in ["setup-indexes", "verify-indexes"]:
+        import psycopg2
+        conn = psycopg2.connect(connection_string)
+        if sys.argv[1] == "setup-indexes":
+            setup_indexes(conn, float(sys.argv[2]))
+            verified = verify_indexes(conn, float(sys.argv[2]))
+        else:
+            verified = verify_indexes(conn, float(sys.argv[2]), *sys.argv[3:4])
+        conn.close()
+        sys.exit(0 if verified else 1)
+    keywords = " ".join(pd.read_csv(sys.argv[2]).keywords).split()
+    backends = {"postgres" : PostgresGraph(connection_string)}
+    if len(sys.argv) > 3:
+        backends["local"] = local_graph.LocalGraph(sys.argv[3])
+    for name in backends:
+        print(name, "took", round(benchmark_backend(backends[name], keywords, 4, 2), 3), "seconds for", len(set(keywords)), "keywords.")
+        backends[name].close()
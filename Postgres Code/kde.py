@@ -0,0 +1,265 @@
+# This file holds the vectorized KDE (kernel density estimation) used by 'Dynamic CD Update v2.py'.
+#
+# class_words is turned into a sparse (categories x vocab x depth) count array. It is stored as one row per
+#    (category, uri) pair that is in class_words: entry_category and entry_uri say which category and which
+#    vocab column the row is, and counts holds its per-depth counts. The rows of each category are together and
+#    in the same order as the uris in class_words[category], so everything that indexes the KDE values by the
+#    position of a uri in class_words[category] keeps working.
+#
+# The KDE value of every row is then one matrix-vector product of the counts against the kernel vector (one
+#    weight for each depth, see kernels.py), and the per-category n and normalization are sums over the rows of each category.
+#    The product and the sums are added up in the same order the old nested loops did, so the values come
+#    out exactly the same, not just the same up to rounding.
+#
+# The test rows are scored all at once too, by SparseClassifier. Every test uri is looked up once in uri_index (a
+#    dictionary, so O(1) instead of searching list(class_words[x])), and the scores of all rows x categories are
+#    one sparse-dense matrix product, so a whole keywords csv can be classified at once. It can be used on its
+#    own to classify new job postings with a saved signature:
+#    python3 kde.py extended_class_words_0.npz new_postings_keywords.csv predictions.csv
+#
+# IncrementalKDE keeps the KDE values of a SignatureStore up to date while its counts are being changed, by only
+#    working out the categories that changed again. Every change of a count is handed to it as a delta, which
+#    moves the n of the category and the kernel sum of the row. kde_norm = values / sum(values) and every value of
+#    a category is divided by the same n * h, so the normalized values are the kernel sums of the rows over their
+#    total, which is kept up to date from the deltas too. These are the same as kde_values() up to rounding.
+#
+# Sources:
+#    https://numpy.org/doc/stable/reference/generated/numpy.matmul.html
+#    https://numpy.org/doc/stable/reference/generated/numpy.bincount.html
+#    https://docs.scipy.org/doc/scipy/reference/generated/scipy.sparse.csr_matrix.html
+
+import sys
+import numpy as np
+import scipy.sparse
+import kernels
+import signature_store
+
+### Classes ########################################################################################################################
+
+class SignatureArrays:
+    # Builds the count arrays out of a class_words dictionary or a signature_store.SignatureStore.
+    # Input: class_words = the {category : {uri : [counts per depth]}} dictionary, or a SignatureStore
+    def __init__(self, class_words):
+        # The categories, in the order of class_words, and the row each one starts on
+        self.categories = list(class_words)
+        self.category_start = np.zeros(len(self.categories) + 1, dtype=np.int64)
+        for i, category in enumerate(self.categories):
+            self.category_start[i + 1] = self.category_start[i] + len(class_words[category])
+        self.entry_category = np.repeat(np.arange(len(self.categories)), np.diff(self.category_start))
+        if isinstance(class_words, signature_store.SignatureStore):
+            # A store already has the arrays, and its uri table is the vocab
+            self.uris = class_words.uris
+            self.uri_index = class_words.uri_ids
+            self.entry_uri = np.concatenate([np.zeros(0, dtype=np.int64)] + [class_words[category].uri_id_values().astype(np.int64) for category in self.categories])
+            self.counts = np.concatenate([np.zeros((0, class_words.depth_width), dtype=np.int64)] + [class_words[category].counts_array().astype(np.int64) for category in self.categories])
+            return
+        # The vocab is every uri in any category, uri_index gives its column
+        self.uris = []
+        self.uri_index = {}
+        entry_uri = []
+        count_blocks = []
+        for category in self.categories:
+            for uri in class_words[category]:
+                if uri not in self.uri_index:
+                    self.uri_index[uri] = len(self.uris)
+                    self.uris.append(uri)
+                entry_uri.append(self.uri_index[uri])
+            if len(class_words[category]) > 0:
+                count_blocks.append(np.array(list(class_words[category].values()), dtype=np.int64))
+        self.entry_uri = np.array(entry_uri, dtype=np.int64)
+        if len(count_blocks) > 0:
+            self.counts = np.concatenate(count_blocks)
+        else:
+            self.counts = np.zeros((0, 10), dtype=np.int64)
+
+    # Returns the values of the input array (one value per row) split up into a list with one array per category
+    def split_by_category(self, values):
+        return [values[self.category_start[i]:self.category_start[i + 1]] for i in range(len(self.categories))]
+
+# Scores rows of keywords against a signature with one sparse-dense matrix product.
+#    The score of a row for a category is the sum over its uris of log(kde value), or log(miss_probability) for a
+#    uri that is not in the category. Every uri adds log(miss_probability) to begin with, so that part is just
+#    (number of uris in the row) * log(miss_probability), and the uris that are in a category add
+#    log(kde value) - log(miss_probability) on top of it. Those gains are a dense (vocab x categories) matrix, and
+#    the rows are a sparse (rows x vocab) matrix of how many times each uri is in each row, so all of the scores
+#    are one product of the two. A second block of columns holds a 1 for every (uri, category) pair that is in the
+#    signature, so the same product also counts the misses.
+#    A uri whose KDE value in a category is 0 (a kernel like "epanechnikov" gives the deeper depths no weight, see
+#    kernels.py) would add log(0) = -inf, so those pairs are left out of both blocks and count as misses instead.
+#    The sums are not added up in the order of the uris in each row, the way the update script's old loop did,
+#    so the scores are the same as that loop's up to rounding.
+class SparseClassifier:
+    # Input: signature = a SignatureArrays
+    #        kde_norm = the normalized KDE values from kde_values()
+    #        miss_probability = the probability used for a uri that is not in the category
+    def __init__(self, signature, kde_norm, miss_probability=.00000000000000000001):
+        self.categories = signature.categories
+        self.uri_index = signature.uri_index
+        self.log_miss = np.log(miss_probability)
+        category_count = len(self.categories)
+        # The columns are [gains of every category, found of every category]
+        self.weights = np.zeros((len(signature.uris), 2 * category_count))
+        found = kde_norm > 0
+        entry_uri = signature.entry_uri[found]
+        entry_category = signature.entry_category[found]
+        self.weights[entry_uri, entry_category] = np.log(kde_norm[found]) - self.log_miss
+        self.weights[entry_uri, category_count + entry_category] = 1
+
+    # Turns rows of uris into the sparse (rows x vocab) matrix of how many times each vocab uri is in each row.
+    #    Uris that are not in the vocab have no column, they are misses in every category.
+    # Input: test_keyword_list = list of the lists of the uris of each row
+    # Return: (matrix, row_lengths), row_lengths is the number of uris in each row, vocab or not
+    def row_matrix(self, test_keyword_list):
+        columns = []
+        indptr = [0]
+        for row in test_keyword_list:
+            for uri in row:
+                if uri in self.uri_index:
+                    columns.append(self.uri_index[uri])
+            indptr.append(len(columns))
+        matrix = scipy.sparse.csr_matrix((np.ones(len(columns)), np.array(columns, dtype=np.int64), np.array(indptr, dtype=np.int64)), shape=(len(test_keyword_list), len(self.uri_index)))
+        # Repeats of a uri in a row are added together
+        matrix.sum_duplicates()
+        row_lengths = np.array([len(row) for row in test_keyword_list], dtype=np.int64)
+        return matrix, row_lengths
+
+    # Input: test_keyword_list = list of the lists of the uris of each row
+    # Return: (scores, missed), both are (rows x categories) arrays, missed is the number of uris of each row that
+    #    are not in each category
+    def score(self, test_keyword_list):
+        matrix, row_lengths = self.row_matrix(test_keyword_list)
+        category_count = len(self.categories)
+        product = matrix @ self.weights
+        scores = row_lengths[:, None] * self.log_miss + product[:, :category_count]
+        missed = row_lengths[:, None] - np.rint(product[:, category_count:]).astype(np.int64)
+        return scores, missed
+
+    # Input: test_keyword_list = list of the lists of the uris of each row
+    # Return: (predicted, missed_list), predicted has the category (a key of class_words) of the best score of
+    #    each row, argmax picks the first of any ties. missed_list is the number of missed uris for each category.
+    def classify(self, test_keyword_list):
+        scores, missed = self.score(test_keyword_list)
+        predicted = [self.categories[index] for index in np.argmax(scores, axis=1)]
+        return predicted, missed.tolist()
+
+# The KDE values of a SignatureStore, kept up to date from the changes to its counts.
+class IncrementalKDE:
+    # Input: store = a signature_store.SignatureStore, its counts are changed with add_delta() after this
+    #        kernel, h = same as for kde_values()
+    def __init__(self, store, kernel, h):
+        self.store = store
+        self.kernel = fit_kernel(kernel, store.depth_width)
+        self.h = h
+        signature = SignatureArrays(store)
+        kde_norm, n = kde_values(signature, self.kernel, h)
+        self.categories = signature.categories
+        # Per category: n (an exact int), the kernel sum of every row, the total of the kernel sums and kde_norm
+        self.n = {category : int(n[i]) for i, category in enumerate(self.categories)}
+        self.sums = {category : (store[category].counts_array().astype(np.float64) @ self.kernel) for category in self.categories}
+        self.totals = {category : float(self.sums[category].sum()) for category in self.categories}
+        self.kde_norm = dict(zip(self.categories, signature.split_by_category(kde_norm)))
+        self.changed = set()
+
+    # Returns the kernel sums of the category, with a row of 0 for every uri that was added to it since
+    def category_sums(self, category):
+        missing_rows = len(self.store[category]) - len(self.sums[category])
+        if missing_rows > 0:
+            self.sums[category] = np.concatenate([self.sums[category], np.zeros(missing_rows)])
+            self.changed.add(category)
+        return self.sums[category]
+
+    # Records a change of delta to the count of the uri at the depth, after it was made in the store
+    def add_delta(self, category, uri, depth, delta):
+        sums = self.category_sums(category)
+        if delta == 0:
+            return
+        sums[self.store[category].rows[uri]] += delta * self.kernel[depth]
+        self.totals[category] += delta * self.kernel[depth]
+        self.n[category] += delta
+        self.changed.add(category)
+
+    # Works out kde_norm again for the categories that changed since the last time.
+    # Return: the number of categories that were worked out again
+    def refresh(self):
+        refreshed = len(self.changed)
+        for category in self.changed:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                self.kde_norm[category] = self.sums[category] / self.totals[category]
+        self.changed.clear()
+        return refreshed
+
+    # Returns (signature, kde_norm) for the store as it is now, the same as SignatureArrays(store) and kde_values()
+    def values(self):
+        for category in self.categories:
+            self.category_sums(category)
+        self.refresh()
+        return SignatureArrays(self.store), np.concatenate([np.zeros(0)] + [self.kde_norm[category] for category in self.categories])
+
+### Functions ######################################################################################################################
+
+# Computes the normalized KDE value of every (category, uri) row.
+#    value = (counts[:, 0] * kernel[0] + ... + counts[:, d] * kernel[d]) / (n * h)
+#    where n is the sum of all of the counts of the category, then each category is divided by its sum.
+# Input: signature = a SignatureArrays
+#        kernel = array of the kernel weight of each depth, see kernels.kernel_weights()
+#        h = the bandwidth
+# Return: (kde_norm, n), kde_norm has one value per row of the signature and n has one value per category
+def kde_values(signature, kernel, h):
+    kernel = fit_kernel(kernel, signature.counts.shape[1])
+    category_count = len(signature.categories)
+    n = np.bincount(signature.entry_category, weights=signature.counts.sum(axis=1), minlength=category_count)
+    # The matrix-vector product counts @ kernel, one depth column at a time
+    values = signature.counts[:, 0] * kernel[0]
+    for depth in range(1, len(kernel)):
+        values = values + signature.counts[:, depth] * kernel[depth]
+    # Empty categories have no rows, so their n is never used
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = (1 / (n[signature.entry_category] * h)) * values
+        # The sum of each category is the last value of a running sum over its rows
+        totals = np.zeros(category_count)
+        for i in range(category_count):
+            if signature.category_start[i + 1] > signature.category_start[i]:
+                totals[i] = np.cumsum(values[signature.category_start[i]:signature.category_start[i + 1]])[-1]
+        kde_norm = values / totals[signature.entry_category]
+    return kde_norm, n
+
+# Returns the kernel vector of a normal distribution, the area under the curve of each tail depth.
+#    Depth d gets the area from d - .5 to d + .5, the same one_sd .. six_sd the update script used.
+# Input: h = the bandwidth
+#        depth_count = how many depths get a weight
+def normal_kernel(h, depth_count=6):
+    return kernels.kernel_weights("gaussian", h, depth_count)
+
+# Returns the kernel as an array with one weight for each of the depth_width depth columns of a signature. A
+#    kernel with fewer depths gives the deeper columns no weight, and the weights of a longer one are left off,
+#    since the signature has no counts that deep.
+def fit_kernel(kernel, depth_width):
+    kernel = np.asarray(kernel, dtype=np.float64)[:depth_width]
+    return np.concatenate([kernel, np.zeros(depth_width - len(kernel))])
+
+# Turns a keywords string from a keywords csv into the list of its uris, the same way the update script does
+def keyword_uris(keywords):
+    return ['/c/en/' + word + '/' for word in keywords.split()]
+
+### Main Code ######################################################################################################################
+
+if __name__ == "__main__":
+    import pandas as pd
+    # Grab the command line arguements
+    if len(sys.argv) < 4:
+        sys.exit("Usage: python3 kde.py <class_words signature> <keywords csv> <predictions csv>")
+    signature_in = sys.argv[1]       # Should look something like "extended_class_words_0.npz"
+    keywords_csv = sys.argv[2]       # Any csv with a keywords column, like "test_set_0_keywords.csv"
+    predictions_out = sys.argv[3]    # Should look something like "predictions_0.csv"
+    h = 1                            # Bandwidth, same as the update script
+    class_words = signature_store.load_signature(signature_in)
+    signature = SignatureArrays(class_words)
+    kde_norm, n = kde_values(signature, normal_kernel(h), h)
+    classifier = SparseClassifier(signature, kde_norm)
+    frame = pd.read_csv(keywords_csv)
+    predicted, missed_list = classifier.classify([keyword_uris(keywords) for keywords in frame.keywords])
+    frame["predicted_category"] = predicted
+    frame.to_csv(predictions_out, index=False)
+    print("Classified", len(frame), "rows, predictions written to", predictions_out)
+    if "category" in frame:
+        print("Accuracy:", (frame["category"] == frame["predicted_category"]).mean())
@@ -0,0 +1,67 @@
+# This file holds the kernels the KDE weights the tail depths with. The weight of depth d is the area under the
+#    kernel (scaled by the bandwidth h) from d - .5 to d + .5, so depth 0 gets the middle of the kernel and the
+#    deeper depths get less and less of its tail. This is what one_sd .. six_sd were for the normal distribution,
+#    but here for any number of depths and any of the kernels below, and worked out in closed form with the math
+#    module so scipy.stats does not have to be imported.
+#
+# The kernels:
+#    - "gaussian" the standard normal distribution, the one the scripts have always used
+#    - "epanechnikov" 3/4 (1 - u^2) for -1 <= u <= 1, so the depths past h get no weight at all
+#    - "exponential" 1/2 e^-|u|, the weights decay by the same factor of e^(-1/h) from one depth to the next
+#
+# Sources:
+#    https://docs.python.org/3/library/math.html#math.erf
+#    https://en.wikipedia.org/wiki/Normal_distribution#Cumulative_distribution_function
+#    https://en.wikipedia.org/wiki/Kernel_(statistics)#Kernel_functions_in_common_use
+
+import math
+import numpy as np
+
+### Functions ######################################################################################################################
+
+# Returns the area under the standard normal distribution from a to b.
+#    Past 0 the difference of two values of erf close to 1 loses most of its digits, so the tails are worked out
+#    with erfc (which is 1 - erf) instead.
+def gaussian_area(a, b):
+    if a >= 0:
+        return .5 * (math.erfc(a / math.sqrt(2)) - math.erfc(b / math.sqrt(2)))
+    if b <= 0:
+        return .5 * (math.erfc(-b / math.sqrt(2)) - math.erfc(-a / math.sqrt(2)))
+    return .5 * (math.erf(b / math.sqrt(2)) - math.erf(a / math.sqrt(2)))
+
+# Returns the area under the Epanechnikov kernel from a to b
+def epanechnikov_area(a, b):
+    a = min(max(a, -1), 1)
+    b = min(max(b, -1), 1)
+    return .75 * ((b - b**3 / 3) - (a - a**3 / 3))
+
+# Returns the area under the exponential (Laplace) kernel from a to b
+def exponential_area(a, b):
+    cdf = lambda u: .5 * math.exp(u) if u < 0 else 1 - .5 * math.exp(-u)
+    if a >= 0:
+        # Same as cdf(b) - cdf(a), without taking it away from 1 first
+        return .5 * (math.exp(-a) - math.exp(-b))
+    return cdf(b) - cdf(a)
+
+# The area function of each kernel, by name
+kernel_areas = {
+    "gaussian" : gaussian_area,
+    "epanechnikov" : epanechnikov_area,
+    "exponential" : exponential_area,
+}
+
+# Returns the kernel vector of the KDE, the weight of each tail depth.
+# Input: kernel_name = one of the names in kernel_areas
+#        h = the bandwidth
+#        depth_count = how many depths get a weight, depth 0 (the keyword) up to depth_count - 1
+# Return: array of depth_count weights, depth d gets the area of the kernel from (d - .5)/h to (d + .5)/h
+#    A kernel that gives every tail depth (past the keyword) a weight of 0 would make every uri but the keywords a
+#    miss, so that raises a ValueError.
+def kernel_weights(kernel_name, h, depth_count=6):
+    if kernel_name not in kernel_areas:
+        raise ValueError("Unknown kernel " + repr(kernel_name) + ", it has to be one of " + ", ".join(kernel_areas))
+    area = kernel_areas[kernel_name]
+    weights = np.array([area((depth - .5) / h, (depth + .5) / h) for depth in range(depth_count)])
+    if depth_count > 1 and not np.any(weights[1:] > 0):
+        raise ValueError("The " + kernel_name + " kernel with an h of " + str(h) + " gives every tail depth a weight of 0, use a larger h")
+    return weights
@@ -0,0 +1,249 @@
+# This file builds the class_words signatures of all of the K folds from one pass over the rows. Each training set
+#    has most of the same rows as the others, so building every fold with 'Categorical Distribution Creation.py'
+#    walks the tails of every row K - 1 times. But edge_check is cleared for every row, so what a row adds to its
+#    category does not depend on any other row. So:
+#    - Every distinct row of the training sets is walked once, and what it adds (its contribution) is kept as
+#      arrays of (uri, depth, count).
+#    - Each fold's signature is the sum of the contributions of the rows in its training set. The rows are added
+#      in the order of the training set csv, so every uri ends up in the same place (and the counts are the same)
+#      as if 'Categorical Distribution Creation.py' had made it.
+#
+# To build class_words_N.npz out of training_set_N_keywords.csv for N = 0 up to num_folds - 1:
+#    python3 kfold_signatures.py <num_folds> [contributions file]
+# walk_rows() is also used by 'Categorical Distribution Creation.py' to walk its rows on more than one worker.
+# If a contributions file is given, the contributions are saved to it and loaded from it the next time, so the
+#    rows do not have to be walked again (only the rows that are not in it are).
+#
+# Sources:
+#    https://numpy.org/doc/stable/reference/generated/numpy.unique.html
+#    https://numpy.org/doc/stable/reference/generated/numpy.ufunc.at.html
+
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import traversal
+import graph_access
+import signature_store
+import signature_settings
+import async_graph
+
+### Variable Setup #################################################################################################################
+
+# The settings the signatures are made with, the same ones 'Categorical Distribution Creation.py' uses, see
+#    signature_settings.py
+local_graph_folder = signature_settings.local_graph_folder
+minimum_weight = signature_settings.minimum_weight
+tail_length = signature_settings.tail_length
+depth_width = signature_settings.depth_width
+tail_memo_max_size = signature_settings.tail_memo_max_size
+async_prefetch = signature_settings.async_prefetch
+recursive_tails = signature_settings.recursive_tails
+worker_count = signature_settings.worker_count # How many rows to walk at the same time, see walk_rows()
+
+# The categories of the signatures
+categories = range(1, 13)
+
+### Classes ########################################################################################################################
+
+# The contributions of a list of rows. The entries of row r are entry_offsets[r] up to entry_offsets[r+1] of
+#    uri_ids, depths and counts, in the order update_class_words would have first been called with them.
+class RowContributions:
+    def __init__(self):
+        self.job_ids = []
+        self.row_categories = []
+        self.uris = []
+        self.uri_ids = {}
+        self.entry_offsets = [0]
+        self.entry_uri_ids = []
+        self.entry_depths = []
+        self.entry_counts = []
+        self.row_of_job_id = {}
+
+    # Adds the contribution of one row.
+    # Input: job_id, category = of the row
+    #        entries = list of (uri, depth, count), in order
+    def add_row(self, job_id, category, entries):
+        self.row_of_job_id[job_id] = len(self.job_ids)
+        self.job_ids.append(job_id)
+        self.row_categories.append(category)
+        for uri, depth, count in entries:
+            if uri not in self.uri_ids:
+                self.uri_ids[uri] = len(self.uris)
+                self.uris.append(uri)
+            self.entry_uri_ids.append(self.uri_ids[uri])
+            self.entry_depths.append(depth)
+            self.entry_counts.append(count)
+        self.entry_offsets.append(len(self.entry_uri_ids))
+
+    # Returns (uri_ids, depths, counts, categories) arrays of all of the entries of the input rows, in order
+    def entries_of_rows(self, rows):
+        offsets = np.array(self.entry_offsets, dtype=np.int64)
+        rows = np.array(rows, dtype=np.int64)
+        lengths = offsets[rows + 1] - offsets[rows]
+        # The entry indexes of every row one after the other, without a python loop over the entries
+        starts = np.repeat(offsets[rows] - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+        entries = starts + np.arange(lengths.sum())
+        entry_categories = np.repeat(np.array(self.row_categories, dtype=np.int64)[rows], lengths)
+        return np.array(self.entry_uri_ids, dtype=np.int64)[entries], np.array(self.entry_depths, dtype=np.int64)[entries], np.array(self.entry_counts, dtype=np.int64)[entries], entry_categories
+
+    # Sums the contributions of the rows with the input job_ids into a signature.
+    # Input: job_ids = the job_ids of the training set, in the order of the training set csv
+    #        width = the depth_width of the signature, None for the depth_width setting
+    # Return: a signature_store.SignatureStore
+    def assemble(self, job_ids, width=None):
+        if width is None:
+            width = depth_width
+        store = signature_store.SignatureStore(categories, width)
+        rows = [self.row_of_job_id[job_id] for job_id in job_ids]
+        uri_ids, depths, counts, entry_categories = self.entries_of_rows(rows)
+        for category in store:
+            in_category = entry_categories == category
+            if not np.any(in_category):
+                continue
+            # The uris of the category, in the order they first show up
+            unique_uris, first_index, inverse = np.unique(uri_ids[in_category], return_index=True, return_inverse=True)
+            order = np.argsort(first_index)
+            rank = np.empty(len(order), dtype=np.int64)
+            rank[order] = np.arange(len(order))
+            category_counts = np.zeros((len(order), width), dtype=np.int64)
+            np.add.at(category_counts, (rank[inverse.reshape(-1)], depths[in_category]), counts[in_category])
+            store[category].load([self.uris[uri_id] for uri_id in unique_uris[order].tolist()], category_counts)
+        store.job_ids = set(job_ids)
+        return store
+
+    # The contributions only hold for the minimum_weight and tail_length they were walked with, so those are saved too
+    def save(self, path):
+        # Written to an open file so numpy does not add .npz to the name a second time
+        with open(path, "wb") as f:
+            np.savez(f,
+                minimum_weight = np.array(minimum_weight),
+                tail_length = np.array(tail_length),
+                job_ids = np.array(self.job_ids, dtype=np.int64),
+                row_categories = np.array(self.row_categories, dtype=np.int64),
+                uris = np.array(self.uris, dtype=np.str_),
+                entry_offsets = np.array(self.entry_offsets, dtype=np.int64),
+                entry_uri_ids = np.array(self.entry_uri_ids, dtype=np.uint32),
+                entry_depths = np.array(self.entry_depths, dtype=np.uint8),
+                entry_counts = np.array(self.entry_counts, dtype=np.uint32))
+
+    @staticmethod
+    def load(path):
+        arrays = np.load(path)
+        if float(arrays["minimum_weight"]) != minimum_weight or int(arrays["tail_length"]) != tail_length:
+            raise ValueError(path + " was walked with a minimum_weight of " + str(float(arrays["minimum_weight"])) + " and a tail_length of " + str(int(arrays["tail_length"])) + ", not " + str(minimum_weight) + " and " + str(tail_length))
+        contributions = RowContributions()
+        contributions.job_ids = arrays["job_ids"].tolist()
+        contributions.row_categories = arrays["row_categories"].tolist()
+        contributions.uris = arrays["uris"].tolist()
+        contributions.uri_ids = {uri : i for i, uri in enumerate(contributions.uris)}
+        contributions.entry_offsets = arrays["entry_offsets"].tolist()
+        contributions.entry_uri_ids = arrays["entry_uri_ids"].tolist()
+        contributions.entry_depths = arrays["entry_depths"].tolist()
+        contributions.entry_counts = arrays["entry_counts"].tolist()
+        contributions.row_of_job_id = {job_id : row for row, job_id in enumerate(contributions.job_ids)}
+        return contributions
+
+### Functions ######################################################################################################################
+
+# Walks one row, the same way count_row() in 'Categorical Distribution Creation.py' does.
+# Input: keywords = the keywords string of the row
+#        graph = the graph to use, from graph_access.open_graph()
+#        tail_memo = a traversal.TailMemo
+# Return: (entries, missing_words), entries is a list of (uri, depth, count) in the order the uris were first
+#    counted, with each (uri, depth) only once
+def walk_row(keywords, graph, tail_memo):
+    edge_check = set()
+    neighbourhoods = {}
+    entries = {}
+    missing_words = []
+    for word in keywords.split():
+        keyword_results = graph.resolve(word)
+        if len(keyword_results) == 0:
+            missing_words.append(word)
+            continue
+        uri = traversal.clean_uri(keyword_results[0][1])
+        entries[(uri, 0)] = entries.get((uri, 0), 0) + 1
+        for uri, depth, count in tail_memo.tail_counts(keyword_results[0][0], edge_check, neighbourhoods):
+            entries[(uri, depth)] = entries.get((uri, depth), 0) + count
+    return [(uri, depth, entries[(uri, depth)]) for uri, depth in entries], missing_words
+
+# Walks a list of rows, each with its own edge_check. With more than one worker the rows are split into
+#    worker_count blocks that are walked at the same time on a pool of threads, each worker with its own graph
+#    (so its own database connection, edge cache connection and tail memo). The walks are put back in the order of
+#    the rows, so the results are the same for any worker_count.
+# Input: keywords_list = list of the keywords strings of the rows
+#        worker_count = how many rows to walk at the same time
+#        local_graph_folder, minimum_weight, tail_length, tail_memo_max_size, async_prefetch, recursive_tails = the
+#            settings of the script, see 'Categorical Distribution Creation.py'
+# Return: list of walk_row() results, one for each row
+def walk_rows(keywords_list, worker_count, local_graph_folder, minimum_weight, tail_length, tail_memo_max_size, async_prefetch=False, recursive_tails=False):
+    def walk_block(block):
+        graph = graph_access.open_graph(local_graph_folder)
+        fetch_many = None
+        if recursive_tails:
+            fetch_many = lambda keyword_ids: graph.tails_many(keyword_ids, tail_length, minimum_weight)
+        tail_memo = traversal.TailMemo(lambda node_ids: graph.neighbors_many(node_ids, minimum_weight), tail_length, tail_memo_max_size, fetch_many)
+        try:
+            resolved_keywords = graph.resolve_many(" ".join(block).split())
+            if async_prefetch:
+                async_graph.prefetch_tails(graph, [(resolved_keywords[a][0][0], tail_length) for a in resolved_keywords if len(resolved_keywords[a]) > 0], minimum_weight)
+            tail_memo.remember_many([resolved_keywords[a][0][0] for a in resolved_keywords if len(resolved_keywords[a]) > 0])
+            walks = []
+            for keywords in block:
+                walks.append(walk_row(keywords, graph, tail_memo))
+                print("Walked job", len(walks), "of", len(block), "in this block")
+            print(tail_memo.stats_string())
+            print(graph.stats_string())
+        finally:
+            graph.close()
+        return walks
+
+    if worker_count <= 1 or len(keywords_list) <= 1:
+        return walk_block(keywords_list)
+    block_size = -(-len(keywords_list) // worker_count) # Rounded up
+    blocks = [keywords_list[start:start + block_size] for start in range(0, len(keywords_list), block_size)]
+    with ThreadPoolExecutor(max_workers = len(blocks)) as pool:
+        return [walk for walks in pool.map(walk_block, blocks) for walk in walks]
+
+# Walks every row of the frames that is not already in contributions.
+# Input: frames = list of keywords data frames, rows in more than one of them are only walked once
+#        contributions = a RowContributions to add to
+# Output: None
+def add_contributions(frames, contributions):
+    rows = pd.concat(frames).drop_duplicates(subset="job_id")
+    rows = rows[[int(job_id) not in contributions.row_of_job_id for job_id in rows.job_id]]
+    walks = walk_rows(list(rows.keywords), worker_count, local_graph_folder, minimum_weight, tail_length, tail_memo_max_size, async_prefetch, recursive_tails)
+    missing_count = 0
+    for i in range(len(rows)):
+        entries, missing_words = walks[i]
+        missing_count = missing_count + len(missing_words)
+        contributions.add_row(int(rows.job_id.iloc[i]), int(rows.category.iloc[i]), entries)
+    print("Words not found in ConceptNet:", missing_count)
+
+### Main Code ######################################################################################################################
+
+if __name__ == "__main__":
+    # Grab the command line arguements
+    if len(sys.argv) < 2:
+        sys.exit("Usage: python3 kfold_signatures.py <num_folds> [contributions file]")
+    num_folds = int(sys.argv[1])
+    contributions_file = None
+    if len(sys.argv) > 2:
+        contributions_file = sys.argv[2]       # Should look something like "row_contributions.npz"
+
+    training_frames = [pd.read_csv("training_set_" + str(fold) + "_keywords.csv") for fold in range(num_folds)]
+    if contributions_file is not None and os.path.exists(contributions_file):
+        contributions = RowContributions.load(contributions_file)
+        print("Loaded the contributions of", len(contributions.job_ids), "rows from", contributions_file)
+    else:
+        contributions = RowContributions()
+    add_contributions(training_frames, contributions)
+    if contributions_file is not None:
+        contributions.save(contributions_file)
+
+    for fold in range(num_folds):
+        signature_out = "class_words_" + str(fold) + ".npz"
+        print("Assembling", signature_out, "out of", len(training_frames[fold]), "rows.")
+        signature_store.save_signature(contributions.assemble([int(job_id) for job_id in training_frames[fold].job_id]), signature_out)
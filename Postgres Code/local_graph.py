@@ -0,0 +1,236 @@
+# This file lets the scripts run with no database at all. It has two parts:
+#    - An extraction command that exports the part of ConceptNet the pipeline uses (the english '/c/en/' nodes
+#      and the edges between them with a weight above a minimum_weight) out of Postgres once, into a folder of
+#      numpy arrays in CSR (compressed sparse row) form.
+#    - LocalGraph, a graph_access backend which memory-maps that folder and answers the same node and edge
+#      queries as the database.
+#
+# The CSR arrays are indexed by the local index of a node (its position in node_ids). The edges of the node
+#    with local index i are the entries indptr[i] up to indptr[i+1] of neighbor_nodes, edge_ids, relation_ids,
+#    weights and is_start. Every edge is stored under both of its nodes, ordered by edge id, the same as
+#    query_edges_many returns them.
+#
+# To extract the subgraph (the folder can be named anything):
+#    python3 local_graph.py conceptnet_en_4 4
+#
+# Sources:
+#    https://numpy.org/doc/stable/reference/generated/numpy.load.html
+#    https://docs.scipy.org/doc/scipy/reference/generated/scipy.sparse.csr_matrix.html
+#    https://www.psycopg.org/docs/usage.html#server-side-cursors
+
+import os
+import sys
+import numpy as np
+import graph_access
+
+### Variable Setup #################################################################################################################
+
+# The uris of the english nodes look like '/c/en/<word>'
+english_uri_start = "/c/en/"
+
+# Extraction queries, the english only filter is done with the uri of both nodes of an edge
+extract_nodes_string = "SELECT id,uri FROM nodes WHERE uri LIKE '/c/en/%' ORDER BY id;"
+extract_relations_string = "SELECT id,uri FROM relations ORDER BY id;"
+extract_edges_string = "SELECT e.id,e.relation_id,e.start_id,e.end_id,e.weight FROM edges e JOIN nodes s ON s.id = e.start_id JOIN nodes t ON t.id = e.end_id WHERE e.weight > %s AND s.uri LIKE '/c/en/%%' AND t.uri LIKE '/c/en/%%';"
+
+# How many rows the server side cursor sends at once while extracting
+extract_itersize = 100000
+
+# The names of the arrays in the folder
+array_names = ["node_ids", "uri_offsets", "uri_data", "uri_order", "indptr", "neighbor_nodes", "edge_ids", "relation_ids", "weights", "is_start", "relation_ids_table", "relation_uris"]
+
+### Extraction #####################################################################################################################
+
+# Exports the english subgraph into a folder of .npy files.
+# Input: conn = an open psycopg2 connection to the conceptnet5 database
+#        folder = the folder to write the arrays to, it is made if it does not exist
+#        minimum_weight = only edges with a weight above this are exported
+# Output: None
+def extract_subgraph(conn, folder, minimum_weight):
+    os.makedirs(folder, exist_ok=True)
+
+    print("Grabbing the english nodes...")
+    cur = conn.cursor()
+    cur.execute(extract_nodes_string)
+    node_rows = cur.fetchall()
+    cur.close()
+    node_ids = np.array([row[0] for row in node_rows], dtype=np.int64)
+    uris = [row[1].encode("utf-8") for row in node_rows]
+    del node_rows
+    print("Found", len(node_ids), "english nodes.")
+
+    # Intern all of the uris into one big byte array, uri i is uri_data[uri_offsets[i]:uri_offsets[i+1]]
+    uri_offsets = np.zeros(len(uris) + 1, dtype=np.int64)
+    uri_offsets[1:] = np.cumsum([len(uri) for uri in uris])
+    uri_data = np.frombuffer(b"".join(uris), dtype=np.uint8)
+    # The local indexes sorted by uri, so a uri can be found with a binary search
+    uri_order = np.array(sorted(range(len(uris)), key=uris.__getitem__), dtype=np.int32)
+    del uris
+
+    cur = conn.cursor()
+    cur.execute(extract_relations_string)
+    relation_rows = cur.fetchall()
+    cur.close()
+    relation_ids_table = np.array([row[0] for row in relation_rows], dtype=np.int64)
+    relation_uris = np.array([row[1] for row in relation_rows], dtype=np.str_)
+
+    print("Grabbing the edges with a weight above", minimum_weight, "...")
+    # A named cursor is a server side cursor, so the edges are streamed instead of all loaded at once
+    cur = conn.cursor(name="extract_edges")
+    cur.itersize = extract_itersize
+    cur.execute(extract_edges_string, (minimum_weight,))
+    edge_chunks = []
+    while True:
+        rows = cur.fetchmany(extract_itersize)
+        if len(rows) == 0:
+            break
+        edge_chunks.append(np.array(rows, dtype=np.float64))
+    cur.close()
+    if len(edge_chunks) > 0:
+        edges = np.concatenate(edge_chunks)
+    else:
+        edges = np.zeros((0, 5), dtype=np.float64)
+    print("Found", len(edges), "edges.")
+
+    edge_id = edges[:, 0].astype(np.int64)
+    relation_id = edges[:, 1].astype(np.int64)
+    start = np.searchsorted(node_ids, edges[:, 2].astype(np.int64))
+    end = np.searchsorted(node_ids, edges[:, 3].astype(np.int64))
+    weight = edges[:, 4].astype(np.float32)
+    del edges
+
+    # Every edge goes under both of its nodes, except self loops which only go under their node once
+    not_loop = start != end
+    rows = np.concatenate([start, end[not_loop]])
+    neighbor_nodes = np.concatenate([end, start[not_loop]]).astype(np.int32)
+    edge_ids = np.concatenate([edge_id, edge_id[not_loop]])
+    relation_ids = np.concatenate([relation_id, relation_id[not_loop]]).astype(np.int32)
+    weights = np.concatenate([weight, weight[not_loop]])
+    is_start = np.concatenate([np.ones(len(start), dtype=np.bool_), np.zeros(int(not_loop.sum()), dtype=np.bool_)])
+
+    # Sort by node, then by edge id
+    order = np.lexsort((edge_ids, rows))
+    indptr = np.zeros(len(node_ids) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(rows, minlength=len(node_ids)))
+
+    arrays = {
+        "node_ids" : node_ids,
+        "uri_offsets" : uri_offsets,
+        "uri_data" : uri_data,
+        "uri_order" : uri_order,
+        "indptr" : indptr,
+        "neighbor_nodes" : neighbor_nodes[order],
+        "edge_ids" : edge_ids[order],
+        "relation_ids" : relation_ids[order],
+        "weights" : weights[order],
+        "is_start" : is_start[order],
+        "relation_ids_table" : relation_ids_table,
+        "relation_uris" : relation_uris,
+    }
+    for name in array_names:
+        np.save(os.path.join(folder, name + ".npy"), arrays[name])
+    with open(os.path.join(folder, "minimum_weight.txt"), "w") as f:
+        f.write(str(minimum_weight))
+    print("Subgraph written to", folder)
+
+### Classes ########################################################################################################################
+
+class LocalGraph(graph_access.GraphBackend):
+    # Memory-maps a folder made by extract_subgraph(), so loading it is almost instant and only the pages
+    #    that are used are read from disk.
+    # Input: folder = the folder the subgraph was extracted to
+    def __init__(self, folder):
+        self.folder = folder
+        for name in array_names:
+            setattr(self, name, np.load(os.path.join(folder, name + ".npy"), mmap_mode="r"))
+        with open(os.path.join(folder, "minimum_weight.txt")) as f:
+            self.minimum_weight = float(f.read())
+        self.relation_uri_by_id = dict(zip(self.relation_ids_table.tolist(), self.relation_uris.tolist()))
+
+    # Returns the uri of the node with the input local index
+    def uri(self, index):
+        return bytes(self.uri_data[self.uri_offsets[index]:self.uri_offsets[index + 1]]).decode("utf-8")
+
+    # Returns the local index of the node with the input uri, or None if it is not in the subgraph.
+    #    This is a binary search over uri_order.
+    def find_uri(self, uri):
+        target = uri.encode("utf-8")
+        low = 0
+        high = len(self.uri_order)
+        while low < high:
+            middle = (low + high) // 2
+            index = self.uri_order[middle]
+            if bytes(self.uri_data[self.uri_offsets[index]:self.uri_offsets[index + 1]]) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self.uri_order) and self.uri(self.uri_order[low]) == uri:
+            return int(self.uri_order[low])
+        return None
+
+    # See graph_access.GraphBackend.
+    # Input: words = an iterable of words
+    # Return: Dictionary of {word : [(id, uri)]}, the list is empty if the word is not in the subgraph
+    def resolve_many(self, words):
+        resolved = {}
+        for word in dict.fromkeys(words):
+            index = self.find_uri(english_uri_start + word)
+            if index is None:
+                resolved[word] = []
+            else:
+                resolved[word] = [(int(self.node_ids[index]), english_uri_start + word)]
+        return resolved
+
+    # See graph_access.GraphBackend. The edges are rebuilt into the same tuples the edges table gives:
+    #    (id, uri, relation_id, start_id, end_id, weight)
+    # Input: node_ids = an iterable of ConceptNet node ids
+    #        minimum_weight = only edges above this weight are returned, this can not be lower than the
+    #            minimum_weight the subgraph was extracted with
+    # Return: Dictionary of {node_id : [edges]}
+    def neighbors_many(self, node_ids, minimum_weight):
+        if minimum_weight < self.minimum_weight:
+            raise ValueError("The subgraph in " + self.folder + " was extracted with a minimum_weight of " + str(self.minimum_weight) + ", it can not answer queries for " + str(minimum_weight))
+        node_ids = list(dict.fromkeys(node_ids))
+        grouped_edges = {}
+        indexes = np.searchsorted(self.node_ids, np.array(node_ids, dtype=np.int64)).tolist()
+        for node_id, index in zip(node_ids, indexes):
+            grouped_edges[node_id] = []
+            # Non english nodes are not in the subgraph, so they have no edges
+            if index >= len(self.node_ids) or self.node_ids[index] != node_id:
+                continue
+            node_uri = self.uri(index)
+            # The node's edges are one slice of each CSR array, the light ones are left out with a mask over it
+            start = int(self.indptr[index])
+            end = int(self.indptr[index + 1])
+            weights = self.weights[start:end]
+            keep = weights > minimum_weight
+            others = self.neighbor_nodes[start:end][keep]
+            other_ids = self.node_ids[others].tolist()
+            edge_ids = self.edge_ids[start:end][keep].tolist()
+            relation_ids = self.relation_ids[start:end][keep].tolist()
+            is_start = self.is_start[start:end][keep].tolist()
+            uri_starts = self.uri_offsets[others].tolist()
+            uri_ends = self.uri_offsets[others + 1].tolist()
+            for k, weight in enumerate(weights[keep].tolist()):
+                other_uri = bytes(self.uri_data[uri_starts[k]:uri_ends[k]]).decode("utf-8")
+                if is_start[k]:
+                    start_id, end_id, start_uri, end_uri = node_id, other_ids[k], node_uri, other_uri
+                else:
+                    start_id, end_id, start_uri, end_uri = other_ids[k], node_id, other_uri, node_uri
+                edge_uri = "/a/[" + self.relation_uri_by_id.get(relation_ids[k], "/r/" + str(relation_ids[k])) + "/," + start_uri + "/," + end_uri + "/]"
+                grouped_edges[node_id].append((edge_ids[k], edge_uri, relation_ids[k], start_id, end_id, weight))
+        return grouped_edges
+
+### Main Code ########################################################################################################################
+
+if __name__ == "__main__":
+    import psycopg2
+    # Grab the command line arguements
+    folder = sys.argv[1]                  # Should look something like "conceptnet_en_4"
+    minimum_weight = float(sys.argv[2])   # Should be the same as (or lower than) minimum_weight in the scripts
+    print("Connecting to the Database...")
+    conn = psycopg2.connect(graph_access.connection_string)
+    print("Connection established.")
+    extract_subgraph(conn, folder, minimum_weight)
+    conn.close()
+    print("Connection closed.")
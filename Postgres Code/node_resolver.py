@@ -0,0 +1,60 @@
+# This file holds an in-process memoization layer for turning words into ConceptNet node ids. The same few
+#    thousand keywords are looked up over and over again, so every result is kept in a bounded LRU
+#    (least recently used) cache and a whole list of words can be resolved with one query.
+#
+# Sources:
+#    https://docs.python.org/3/library/collections.html#collections.OrderedDict
+
+from collections import OrderedDict
+
+### Classes ########################################################################################################################
+
+class NodeResolver:
+    # Input: fetch_words_many = function that takes a list of words and returns a dictionary of {word : [(id, uri)]}
+    #            for the '/c/en/<word>' nodes, this should be a graph backend's resolve_many
+    #        max_size = the most words to remember, the least recently used ones are forgotten past this
+    def __init__(self, fetch_words_many, max_size=100000):
+        self.fetch_words_many = fetch_words_many
+        self.max_size = max_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # Adds a word to the cache, forgetting the least recently used word if the cache is full.
+    def remember(self, word, node_results):
+        self.cache[word] = node_results
+        self.cache.move_to_end(word)
+        if len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
+    # Returns the same thing as query_node(word), a list of the (id, uri) rows for the word. Words that are not
+    #    in ConceptNet are remembered too (as an empty list), so they are not queried again either.
+    def resolve(self, word):
+        return self.resolve_many([word])[word]
+
+    # Resolves a whole list of words (e.g. a row's or a whole csv's keywords) at once. Only the words that are
+    #    not already remembered are queried, and they are all done in one query.
+    # Input: words = an iterable of words
+    # Return: Dictionary of {word : [(id, uri)]}, the list is empty if the word is not in ConceptNet
+    def resolve_many(self, words):
+        words = list(dict.fromkeys(words))
+        resolved = {}
+        missing = []
+        for word in words:
+            if word in self.cache:
+                self.cache.move_to_end(word)
+                resolved[word] = self.cache[word]
+            else:
+                missing.append(word)
+        self.hits = self.hits + len(resolved)
+        self.misses = self.misses + len(missing)
+        if len(missing) > 0:
+            fetched = self.fetch_words_many(missing)
+            for word in missing:
+                resolved[word] = fetched.get(word, [])
+                self.remember(word, resolved[word])
+        return resolved
+
+    # Returns a string of the hit/miss counters, useful for terminal output.
+    def stats_string(self):
+        return "Node resolver hits: " + str(self.hits) + ", misses: " + str(self.misses) + ", words remembered: " + str(len(self.cache))
@@ -0,0 +1,39 @@
+# This file holds the settings the signatures are made with. 'Categorical Distribution Creation.py',
+#    kfold_signatures.py (which RunTrial.py uses to make the signatures of every fold at once) and
+#    'Dynamic CD Update v2.py' all read them from here, so a signature is walked the same way whichever one made it,
+#    and the update extends it with the same minimum_weight. Change them here, not in the scripts.
+
+import signature_store
+
+### Variable Setup #################################################################################################################
+
+# The folder of a subgraph made by 'local_graph.py'. If this is set the subgraph is used instead of the database,
+#    so no database is needed at all. Leave it as None to use the database.
+local_graph_folder = None
+
+# The minimum_weight for an edge to be considered when building the subgraph
+minimum_weight = 4
+
+# The number of edges to search out from. A tail_length of 3 means we will search out 3 edges, or 4 nodes out from the keyword.
+#     THIS MUST BE AT LEAST 2!
+tail_length = 2
+
+# The number of tail depths stored for every uri, this has to be more than both the tail_length and the deepest
+#    depth the update script goes out to (5), see signature_store.depth_width_for()
+depth_width = signature_store.depth_width_for(tail_length)
+
+# If this is True the tails of all of the keywords are fetched from the database at the same time before the rows
+#    are counted, see async_graph.py. This needs psycopg 3, the counts come out the same either way.
+async_prefetch = False
+
+# If this is True the tail edges of a whole batch of keywords are fetched at once up front, see
+#    graph_access.GraphBackend.tails_many(). This needs the tail memo, the counts come out the same either way.
+recursive_tails = False
+
+# How many rows to walk at the same time. With more than 1 the rows are walked first on a pool of worker_count
+#    threads, each with its own database connection and its own edge_check, then counted in order, see
+#    kfold_signatures.walk_rows(). The counts come out the same as with 1.
+worker_count = 1
+
+# The most keywords to remember the tails of, see traversal.TailMemo. Set it to 0 to walk every tail every time.
+tail_memo_max_size = 10000
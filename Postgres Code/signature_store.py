@@ -0,0 +1,374 @@
+# This file holds SignatureStore, a compact version of the class_words dictionary.
+#
+# class_words used to be {category : {uri : [10 counts]}}, so every uri of every category had its own python list
+#    of 10 boxed ints, and only the first 6 are ever read by the KDE. SignatureStore keeps:
+#    - one interned table of every uri (uris, and uri_ids to go from a uri to its position in it)
+#    - for every category a (rows x depth_width) uint32 array of the counts, and the uri id of each row
+# Each category is a CategoryCounts, which acts like the old inner dictionary, so class_words[category][uri][depth]
+#    still reads and writes the counts (class_words[category][uri] is a numpy view of the row of the uri).
+#
+# Copying and pickling a SignatureStore only copies the arrays and the uri table, which is a lot faster and smaller
+#    than deepcopy-ing and pickling millions of lists. Old pickles of the dictionary can be turned into a store with
+#    as_store().
+#
+# A store also remembers the job_ids of the training rows that were counted into it, so rows can be added to
+#    (or taken out of) a saved signature without counting any row twice.
+#
+# Signatures are saved with save_signature() in a columnar .npz file instead of a pickle. The file has the uri table
+#    as one byte array with offsets (the same way 'local_graph.py' stores its uris), and the uri ids and counts of
+#    every category as their own arrays. The arrays of a .npz are only read when they are asked for, so
+#    SignatureFile can load just the categories that are needed. Any other file name is read and written as a
+#    pickle, so the old .P files still work. To convert an old pickle:
+#    python3 signature_store.py convert class_words_0.P class_words_0.npz
+#
+# Sources:
+#    https://docs.python.org/3/library/pickle.html#pickling-class-instances
+#    https://numpy.org/doc/stable/reference/arrays.indexing.html
+#    https://numpy.org/doc/stable/reference/generated/numpy.savez.html
+
+import pickle
+import sys
+import numpy as np
+
+### Variable Setup #################################################################################################################
+
+# The deepest depth the update script extends the tails of the keywords out to
+deepest_extension_depth = 5
+
+# The number of depths that are stored for every uri. Depth 0 is the keyword itself, so this has to be more than
+#    the deepest tail depth that is written, see depth_width_for().
+default_depth_width = deepest_extension_depth + 1
+
+# The version of the .npz signature format, saved in the file
+signature_format_version = 1
+
+# How many rows a category starts with room for, the arrays double in size when they run out
+initial_capacity = 64
+
+### Classes ########################################################################################################################
+
+# The counts of one category. Acts like the {uri : counts} dictionary it replaces.
+class CategoryCounts:
+    # Input: store = the SignatureStore this category belongs to, used for its uri table and depth_width
+    def __init__(self, store):
+        self.store = store
+        self.rows = {} # {uri : row}, in the order the uris were added
+        self.size = 0
+        self.uri_id_array = np.zeros(initial_capacity, dtype=np.uint32)
+        self.counts = np.zeros((initial_capacity, store.depth_width), dtype=np.uint32)
+
+    # Returns the row of the uri, adding an empty row for it if it is not in the category yet
+    def row(self, uri):
+        if uri in self.rows:
+            return self.rows[uri]
+        if self.size == len(self.counts):
+            extra = max(initial_capacity, len(self.counts))
+            self.uri_id_array = np.concatenate([self.uri_id_array, np.zeros(extra, dtype=np.uint32)])
+            self.counts = np.concatenate([self.counts, np.zeros((extra, self.store.depth_width), dtype=np.uint32)])
+        uri = self.store.intern(uri)
+        self.uri_id_array[self.size] = self.store.uri_ids[uri]
+        self.rows[uri] = self.size
+        self.size = self.size + 1
+        return self.rows[uri]
+
+    # Adds amount to the count of the uri at the depth, a negative amount takes it away
+    def add(self, uri, depth, amount=1):
+        # The row has to be found first, adding it can give self.counts a new bigger array
+        row = self.row(uri)
+        if amount < 0:
+            if self.counts[row, depth] < -amount:
+                raise ValueError("Can not take " + str(-amount) + " away from the count of " + uri + " at depth " + str(depth) + ", it is only " + str(self.counts[row, depth]))
+            self.counts[row, depth] -= -amount
+        else:
+            self.counts[row, depth] += amount
+
+    # Sets the count of the uri at the depth
+    def set_count(self, uri, depth, value):
+        row = self.row(uri)
+        self.counts[row, depth] = value
+
+    # Fills an empty category with a whole block of uris and their counts at once
+    # Input: uris = list of uris that are not in the category yet
+    #        counts = (len(uris) x depths) array of their counts, the depths past depth_width have to be 0
+    def load(self, uris, counts):
+        if len(uris) == 0:
+            self.__init__(self.store)
+            return
+        counts = np.asarray(counts).reshape(len(uris), -1)
+        if np.any(counts[:, self.store.depth_width:] != 0):
+            raise ValueError("There are counts past the depth_width of " + str(self.store.depth_width))
+        width = min(counts.shape[1], self.store.depth_width)
+        self.uri_id_array = np.array([self.store.uri_ids[self.store.intern(uri)] for uri in uris], dtype=np.uint32)
+        self.counts = np.zeros((len(uris), self.store.depth_width), dtype=np.uint32)
+        self.counts[:, :width] = counts[:, :width]
+        self.size = len(uris)
+        self.rows = {self.store.uris[uri_id] : row for row, uri_id in enumerate(self.uri_id_array.tolist())}
+
+    # Removes the uris whose counts are all 0, which is what is left after all of their rows are taken out.
+    #    A uri with no counts would get a KDE value of 0 instead of being a miss, so they can not stay.
+    # Return: the number of uris removed
+    def drop_empty_rows(self):
+        keep = np.flatnonzero(self.counts_array().any(axis=1))
+        removed = self.size - len(keep)
+        if removed > 0:
+            uris = list(self.rows)
+            self.load([uris[row] for row in keep.tolist()], self.counts[keep])
+        return removed
+
+    # Returns the (rows x depth_width) array of the counts, in the same order as the uris
+    def counts_array(self):
+        return self.counts[:self.size]
+
+    # Returns the uri id (position in the store's uri table) of every row
+    def uri_id_values(self):
+        return self.uri_id_array[:self.size]
+
+    ### The dictionary methods ###
+
+    def __contains__(self, uri):
+        return uri in self.rows
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def keys(self):
+        return self.rows.keys()
+
+    # Returns a view of the counts row of the uri, writing to it changes the counts
+    def __getitem__(self, uri):
+        return self.counts[self.rows[uri]]
+
+    # Input: counts = list of the counts of each depth, it can be longer than depth_width if the extra counts are 0
+    def __setitem__(self, uri, counts):
+        counts = np.asarray(counts)
+        if np.any(counts[self.store.depth_width:] != 0):
+            raise ValueError("The counts of " + uri + " have a depth past the depth_width of " + str(self.store.depth_width))
+        row = self.row(uri)
+        self.counts[row] = 0
+        self.counts[row, :min(len(counts), self.store.depth_width)] = counts[:self.store.depth_width]
+
+    def update(self, other):
+        for uri in other:
+            self[uri] = other[uri]
+
+    def values(self):
+        return [self.counts[row] for row in range(self.size)]
+
+    def items(self):
+        return [(uri, self.counts[row]) for uri, row in self.rows.items()]
+
+# The whole signature, acts like the {category : {uri : counts}} dictionary it replaces.
+class SignatureStore:
+    # Input: categories = iterable of the categories, in order
+    #        depth_width = the number of depths stored for every uri
+    def __init__(self, categories=(), depth_width=default_depth_width):
+        self.depth_width = depth_width
+        self.uris = []
+        self.uri_ids = {}
+        self.categories = {category : CategoryCounts(self) for category in categories}
+        self.job_ids = set() # The job_ids of the training rows counted into the store
+
+    # Adds the uri to the uri table if it is not in it yet.
+    # Return: the copy of the uri string in the table, so every category shares the same string
+    def intern(self, uri):
+        if uri not in self.uri_ids:
+            self.uri_ids[uri] = len(self.uris)
+            self.uris.append(uri)
+        return self.uris[self.uri_ids[uri]]
+
+    # Returns a plain {category : {uri : [counts]}} dictionary of the store, the lists are width long
+    def to_dict(self, width=None):
+        if width is None:
+            width = self.depth_width
+        class_words = {}
+        for category in self.categories:
+            padded = np.zeros((len(self.categories[category]), width), dtype=np.int64)
+            padded[:, :min(width, self.depth_width)] = self.categories[category].counts_array()[:, :width]
+            class_words[category] = dict(zip(self.categories[category].rows, padded.tolist()))
+        return class_words
+
+    ### The dictionary methods ###
+
+    def __getitem__(self, category):
+        return self.categories[category]
+
+    def __contains__(self, category):
+        return category in self.categories
+
+    def __iter__(self):
+        return iter(self.categories)
+
+    def __len__(self):
+        return len(self.categories)
+
+    def keys(self):
+        return self.categories.keys()
+
+    def values(self):
+        return self.categories.values()
+
+    def items(self):
+        return self.categories.items()
+
+    ### Copying and pickling ###
+
+    # Only the arrays that are used are kept, so the pickle has no empty room in it
+    def __getstate__(self):
+        return {
+            "depth_width" : self.depth_width,
+            "uris" : self.uris,
+            "job_ids" : sorted(self.job_ids),
+            "categories" : [(category, self.categories[category].uri_id_values().copy(), self.categories[category].counts_array().copy()) for category in self.categories],
+        }
+
+    def __setstate__(self, state):
+        self.depth_width = state["depth_width"]
+        self.uris = list(state["uris"])
+        self.uri_ids = {uri : i for i, uri in enumerate(self.uris)}
+        # Pickles from before job_ids were kept do not have them
+        self.job_ids = set(state.get("job_ids", []))
+        self.categories = {}
+        for category, uri_id_array, counts in state["categories"]:
+            self.categories[category] = CategoryCounts(self)
+            self.categories[category].load([self.uris[uri_id] for uri_id in uri_id_array.tolist()], counts)
+
+    def copy(self):
+        copied = SignatureStore.__new__(SignatureStore)
+        copied.__setstate__(self.__getstate__())
+        return copied
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+### Functions ######################################################################################################################
+
+# Returns the depth_width a signature walked out to tail_length needs, so both the tails and the extensions the update
+#    script makes fit in it.
+# Input: tail_length = the tail_length the signature is made with
+# Return: the depth_width
+def depth_width_for(tail_length):
+    return max(tail_length, deepest_extension_depth) + 1
+
+# Turns a loaded class_words pickle into a SignatureStore. Stores are returned as they are, and old
+#    {category : {uri : [counts]}} dictionaries are converted.
+# Input: class_words = a SignatureStore or a class_words dictionary
+#        depth_width = the depth_width of the new store if class_words is a dictionary
+# Return: a SignatureStore
+def as_store(class_words, depth_width=default_depth_width):
+    if isinstance(class_words, SignatureStore):
+        return class_words
+    store = SignatureStore(class_words, depth_width)
+    for category in class_words:
+        if len(class_words[category]) > 0:
+            store[category].load(list(class_words[category]), np.array(list(class_words[category].values()), dtype=np.int64))
+    return store
+
+# Saves a signature. A file name ending in .npz gets the columnar format, anything else is pickled.
+# Input: class_words = a SignatureStore or a class_words dictionary
+#        path = the file name to save to
+# Output: None
+def save_signature(class_words, path):
+    if not path.endswith(".npz"):
+        pickle.dump(class_words, open(path, "wb"))
+        return
+    store = as_store(class_words)
+    encoded = [uri.encode("utf-8") for uri in store.uris]
+    uri_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    uri_offsets[1:] = np.cumsum([len(uri) for uri in encoded])
+    arrays = {
+        "format_version" : np.array(signature_format_version),
+        "depth_width" : np.array(store.depth_width),
+        "categories" : np.array(list(store.categories)),
+        "uri_offsets" : uri_offsets,
+        "uri_data" : np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        "job_ids" : np.array(sorted(store.job_ids), dtype=np.int64),
+    }
+    for i, category in enumerate(store.categories):
+        arrays["uri_ids_" + str(i)] = store[category].uri_id_values()
+        arrays["counts_" + str(i)] = store[category].counts_array()
+    # Written to an open file so numpy does not add .npz to the name a second time
+    with open(path, "wb") as f:
+        np.savez(f, **arrays)
+
+# Loads a signature saved by save_signature(), or an old class_words pickle.
+# Input: path = the file name to load
+#        categories = list of the categories to load, None loads all of them (only used for .npz files)
+# Return: a SignatureStore
+def load_signature(path, categories=None):
+    if not path.endswith(".npz"):
+        return as_store(pickle.load(open(path, "rb")))
+    signature_file = SignatureFile(path)
+    store = signature_file.load(categories)
+    signature_file.close()
+    return store
+
+### Signature Files ################################################################################################################
+
+# An open .npz signature. Nothing but the list of categories is read until a category is loaded.
+class SignatureFile:
+    # Input: path = the .npz file name
+    def __init__(self, path):
+        self.arrays = np.load(path)
+        if int(self.arrays["format_version"]) != signature_format_version:
+            raise ValueError(path + " is signature format version " + str(int(self.arrays["format_version"])) + ", only version " + str(signature_format_version) + " can be read")
+        self.depth_width = int(self.arrays["depth_width"])
+        self.categories = self.arrays["categories"].tolist()
+        self.uri_offsets = None
+        self.uri_data = None
+
+    # Returns the uris with the input uri ids out of the uri table of the file
+    def uris(self, uri_ids):
+        if self.uri_offsets is None:
+            self.uri_offsets = self.arrays["uri_offsets"]
+            self.uri_data = self.arrays["uri_data"].tobytes()
+        starts = self.uri_offsets[uri_ids].tolist()
+        ends = self.uri_offsets[uri_ids + 1].tolist()
+        return [self.uri_data[start:end].decode("utf-8") for start, end in zip(starts, ends)]
+
+    # Returns (uris, counts) of one category, counts is its (rows x depth_width) uint32 array
+    def category(self, category):
+        i = self.categories.index(category)
+        uri_ids = self.arrays["uri_ids_" + str(i)].astype(np.int64)
+        return self.uris(uri_ids), self.arrays["counts_" + str(i)]
+
+    # Loads categories into a SignatureStore.
+    # Input: categories = list of the categories to load, None loads all of them
+    # Return: a SignatureStore with only the loaded categories in it
+    def load(self, categories=None):
+        if categories is None:
+            categories = self.categories
+        store = SignatureStore(categories, self.depth_width)
+        # Files from before job_ids were kept do not have them
+        if "job_ids" in self.arrays.files:
+            store.job_ids = set(self.arrays["job_ids"].tolist())
+        if len(categories) < len(self.categories):
+            # Only the uris of the loaded categories are decoded
+            for category in categories:
+                uris, counts = self.category(category)
+                store[category].load(uris, counts)
+            return store
+        # Everything is loaded, so the uri table of the file becomes the uri table of the store as it is
+        store.uris = self.uris(np.arange(len(self.arrays["uri_offsets"]) - 1))
+        store.uri_ids = {uri : uri_id for uri_id, uri in enumerate(store.uris)}
+        for i, category in enumerate(self.categories):
+            counts_of_category = store[category]
+            counts_of_category.uri_id_array = self.arrays["uri_ids_" + str(i)].astype(np.uint32)
+            counts_of_category.counts = self.arrays["counts_" + str(i)].astype(np.uint32).reshape(-1, self.depth_width)
+            counts_of_category.size = len(counts_of_category.counts)
+            counts_of_category.rows = dict(zip(map(store.uris.__getitem__, counts_of_category.uri_id_array.tolist()), range(counts_of_category.size)))
+        return store
+
+    def close(self):
+        self.arrays.close()
+
+### Main Code ######################################################################################################################
+
+if __name__ == "__main__":
+    # Grab the command line arguements
+    if len(sys.argv) < 4 or sys.argv[1] != "convert":
+        sys.exit("Usage: python3 signature_store.py convert <signature in> <signature out>")
+    print("Converting", sys.argv[2], "to", sys.argv[3])
+    save_signature(load_signature(sys.argv[2]), sys.argv[3])
@@ -0,0 +1,212 @@
+# This file runs a sweep over the settings the scripts are tuned with: minimum_weight, tail_length, the bandwidth h
+#    and the threshold constant th_c. Every combination of the grid below is run on every fold, the same way
+#    'Categorical Distribution Creation.py' and 'Dynamic CD Update v2.py' would run it, and the accuracy and time of
+#    each one are written to a results csv. The work is shared between the combinations as much as it can be:
+#    - The rows are walked on the same graph the scripts use, graph_access.open_graph() with the
+#      local_graph_folder of signature_settings.py. From the database the edges of a node are only fetched once
+#      for each minimum_weight, every other time they come out of the edge cache.
+#    - For each (minimum_weight, tail_length) every row of the training sets is walked once for all of the folds
+#      (see kfold_signatures.py). The keywords of a row share their edge_check, so the counts of a stricter setting
+#      can not be filtered out of the counts of a looser one, they are walked again.
+#    - The tails the update extends the keywords with do not depend on the fold, tail_length or th_c, so each
+#      keyword's tail is only walked once for each (minimum_weight, depth) (see ExtensionTails).
+#    - h only changes the KDE, so each h only scores the test sets again.
+#
+# Usage: python3 sweep.py <num_folds> <results csv> [local subgraph folder]
+#    The folds are the training_set_N_keywords.csv and test_set_N_keywords.csv files RunTrial.py uses. A local
+#    subgraph (see local_graph.py, exported at the lowest minimum_weight of the grid or lower) is a lot faster to
+#    walk, but it only has the english nodes, the same as the adjacency table in graph_access.py. The edges table
+#    the scripts use by default also counts the non english neighbours of a node, so a sweep on a local subgraph
+#    only holds for runs on a local subgraph or the adjacency table.
+#
+# Sources:
+#    https://docs.python.org/3/library/itertools.html#itertools.product
+#    https://pandas.pydata.org/docs/reference/api/pandas.DataFrame.groupby.html
+
+import copy
+import itertools
+import math
+import sys
+import time
+import numpy as np
+import pandas as pd
+import traversal
+import graph_access
+import kfold_signatures
+import signature_store
+import signature_settings
+import kde
+import kernels
+
+### Variable Setup #################################################################################################################
+
+# The grid, every combination of these is run
+minimum_weights = [4]
+tail_lengths = [2]
+hs = [1]
+th_cs = [2]
+
+# The kernel the KDE weights the tail depths with, see kernels.py
+kernel_name = "gaussian"
+
+# How many rows to walk at the same time, see kfold_signatures.walk_rows()
+worker_count = 1
+tail_memo_max_size = 10000
+
+# The depths the update script extends the tails of the keywords to, each one has its own threshold
+extension_depths = [3, 4, 5]
+
+### Classes ########################################################################################################################
+
+# The tails the update script extends the keywords with, for one minimum_weight. Every keyword's tail is walked
+#    with its own edge_check for each depth, the same as in the update script, so it does not depend on anything
+#    else and is only walked once. The edges of a keyword are kept, so a deeper tail only fetches the nodes the
+#    shallower ones did not reach.
+class ExtensionTails:
+    # Input: graph = the graph to use, from graph_access.open_graph()
+    #        minimum_weight = the minimum_weight of the edges
+    def __init__(self, graph, minimum_weight):
+        self.graph = graph
+        self.minimum_weight = minimum_weight
+        # {keyword_id : the neighbourhoods fetched for it, see traversal.fetch_tail_edges()}
+        self.neighbourhoods = {}
+        # {(keyword_id, depth) : [uris]}
+        self.tails = {}
+        self.walks = 0
+
+    # Returns the uris the update script records for the keyword at target_depth, each one only once (the update
+    #    only sets counts, so repeats do not matter)
+    def uris(self, keyword_id, target_depth):
+        if (keyword_id, target_depth) not in self.tails:
+            query_edges_many = lambda node_ids: self.graph.neighbors_many(node_ids, self.minimum_weight)
+            neighbourhoods = self.neighbourhoods.setdefault(keyword_id, {})
+            traversal.fetch_tail_edges([keyword_id], 0, query_edges_many, target_depth, neighbourhoods)
+            records = traversal.tail_records(keyword_id, neighbourhoods, target_depth, set())
+            self.tails[(keyword_id, target_depth)] = list(dict.fromkeys(uri for uri, depth in records if depth == target_depth))
+            self.walks = self.walks + 1
+        return self.tails[(keyword_id, target_depth)]
+
+### Functions ######################################################################################################################
+
+# Returns [(depth, threshold)] for a th_c, the same thresholds the update script works out with calcX_for_clnx()
+def thresholds(th_c):
+    return [(depth, round(math.exp(depth / th_c))) for depth in extension_depths]
+
+# Makes the signature of every fold for one (minimum_weight, tail_length), walking every row of the training sets once.
+# Input: training_frames = the training set data frame of each fold
+#        local_graph_folder, minimum_weight, tail_length = the settings to walk the rows with
+# Return: list of the signature_store.SignatureStore of each fold
+def fold_signatures(training_frames, local_graph_folder, minimum_weight, tail_length):
+    contributions = kfold_signatures.RowContributions()
+    rows = pd.concat(training_frames).drop_duplicates(subset="job_id")
+    walks = kfold_signatures.walk_rows(list(rows.keywords), worker_count, local_graph_folder, minimum_weight, tail_length, tail_memo_max_size)
+    for i in range(len(rows)):
+        contributions.add_row(int(rows.job_id.iloc[i]), int(rows.category.iloc[i]), walks[i][0])
+    return [contributions.assemble([int(job_id) for job_id in frame.job_id], signature_store.depth_width_for(tail_length)) for frame in training_frames]
+
+# Extends the tails of the keywords of a signature the same way the update script does.
+# Input: class_words = the signature made with tail_length, it is not changed
+#        extension_tails = the ExtensionTails of the minimum_weight
+#        tail_length = what the signature was made with, the tails are only extended past it
+#        th_c = the threshold constant
+# Return: the extended copy of class_words
+def extend_signature(class_words, extension_tails, tail_length, th_c):
+    extended = copy.deepcopy(class_words)
+    resolved_keywords = extension_tails.graph.resolve_many([y.split('/')[3] for x in class_words for y in class_words[x] if class_words[x][y][0] > 0])
+    for x in class_words:
+        for y in class_words[x]:
+            keyword_number = class_words[x][y][0]
+            if keyword_number == 0:
+                continue
+            target_depths = [depth for depth, threshold in thresholds(th_c) if keyword_number > threshold and depth > tail_length]
+            keyword_results = resolved_keywords[y.split('/')[3]]
+            if len(target_depths) == 0 or len(keyword_results) == 0:
+                continue
+            for depth in target_depths:
+                for uri in extension_tails.uris(keyword_results[0][0], depth):
+                    extended[x].set_count(traversal.clean_uri(uri), depth, keyword_number)
+    return extended
+
+# Returns the accuracy of a signature on a test set with the bandwidth h
+# Input: class_words = the signature
+#        h = the bandwidth
+#        test_rows = list of the lists of the uris of each test row
+#        test_categories = the category of each test row
+def accuracy(class_words, h, test_rows, test_categories):
+    signature = kde.SignatureArrays(class_words)
+    kde_norm, n = kde.kde_values(signature, kernels.kernel_weights(kernel_name, h, class_words.depth_width), h)
+    predicted, missed_list = kde.SparseClassifier(signature, kde_norm).classify(test_rows)
+    return float(np.mean(np.array(predicted) == np.asarray(test_categories)))
+
+# Runs the whole grid.
+# Input: training_frames, test_frames = the training and test set data frames of each fold
+#        local_graph_folder = the subgraph to walk, or None for the database, see graph_access.open_graph()
+# Return: data frame with one row for every (minimum_weight, tail_length, th_c, h, fold). walk_seconds is the time
+#    the rows of the (minimum_weight, tail_length) took for all of the folds, extend_seconds the time the fold's
+#    extension for the th_c took and score_seconds the time the scoring for the h took.
+def run_sweep(training_frames, test_frames, local_graph_folder):
+    test_rows = [[kde.keyword_uris(keywords) for keywords in frame.keywords] for frame in test_frames]
+    results = []
+    for minimum_weight in minimum_weights:
+        graph = graph_access.open_graph(local_graph_folder)
+        extension_tails = ExtensionTails(graph, minimum_weight)
+        for tail_length in tail_lengths:
+            print("Walking the rows with a minimum_weight of", minimum_weight, "and a tail_length of", tail_length)
+            start_time = time.perf_counter()
+            signatures = fold_signatures(training_frames, local_graph_folder, minimum_weight, tail_length)
+            walk_seconds = time.perf_counter() - start_time
+            # The highest th_c has the lowest thresholds, so it fetches the deepest tails first
+            for th_c, fold in itertools.product(sorted(th_cs, reverse=True), range(len(training_frames))):
+                start_time = time.perf_counter()
+                extended = extend_signature(signatures[fold], extension_tails, tail_length, th_c)
+                extend_seconds = time.perf_counter() - start_time
+                for h in hs:
+                    start_time = time.perf_counter()
+                    initial_accuracy = accuracy(signatures[fold], h, test_rows[fold], test_frames[fold].category)
+                    updated_accuracy = accuracy(extended, h, test_rows[fold], test_frames[fold].category)
+                    results.append({
+                        "minimum_weight" : minimum_weight,
+                        "tail_length" : tail_length,
+                        "th_c" : th_c,
+                        "h" : h,
+                        "fold" : fold,
+                        "initial_accuracy" : initial_accuracy,
+                        "updated_accuracy" : updated_accuracy,
+                        "walk_seconds" : walk_seconds,
+                        "extend_seconds" : extend_seconds,
+                        "score_seconds" : time.perf_counter() - start_time,
+                    })
+        print("Walked", extension_tails.walks, "extension tails with a minimum_weight of", minimum_weight)
+        graph.close()
+    return pd.DataFrame(results)
+
+### Main Code ######################################################################################################################
+
+if __name__ == "__main__":
+    # Grab the command line arguements
+    if len(sys.argv) < 3:
+        sys.exit("Usage: python3 sweep.py <num_folds> <results csv> [local subgraph folder]")
+    num_folds = int(sys.argv[1])
+    results_csv = sys.argv[2]            # Should look something like "sweep_results.csv"
+    # The same graph the scripts walk, unless a subgraph is given
+    local_graph_folder = signature_settings.local_graph_folder
+    if len(sys.argv) > 3:
+        local_graph_folder = sys.argv[3] # Should look something like "conceptnet_en_4"
+    if local_graph_folder is not None and local_graph_folder != signature_settings.local_graph_folder:
+        print("WARNING: the sweep walks the english only subgraph in", local_graph_folder, "- its results only hold for runs on a local subgraph or the adjacency table.")
+
+    training_frames = [pd.read_csv("training_set_" + str(fold) + "_keywords.csv") for fold in range(num_folds)]
+    test_frames = [pd.read_csv("test_set_" + str(fold) + "_keywords.csv") for fold in range(num_folds)]
+    sweep_start_time = time.perf_counter()
+    results = run_sweep(training_frames, test_frames, local_graph_folder)
+    results.to_csv(results_csv, index=False)
+
+    # One line for every combination, averaged over the folds
+    summary = results.groupby(["minimum_weight", "tail_length", "th_c", "h"]).agg(
+        initial_accuracy = ("initial_accuracy", "mean"),
+        updated_accuracy = ("updated_accuracy", "mean"),
+        walk_seconds = ("walk_seconds", "first"),
+        extend_seconds = ("extend_seconds", "sum"),
+        score_seconds = ("score_seconds", "sum"))
+    print(summary.to_string())
+    print("Results of", len(results), "runs written to", results_csv, "in", round(time.perf_counter() - sweep_start_time, 1), "seconds.")
@@ -0,0 +1,278 @@
+# This file holds the traversal that goes out the tails of the keywords. It is shared by
+#    'Categorical Distribution Creation.py' and 'Dynamic CD Update v2.py'.
+#
+# A tail is walked in two steps:
+#    - fetch_tail_edges() goes out breadth first, keeping an explicit frontier of the node ids at the current
+#      depth, and grabs the edges of the whole frontier with one query. So fetching a tail of tail_length edges
+#      costs at most tail_length queries, no matter how wide it gets.
+#    - tail_records() then goes over the fetched edges depth first, in the same order the recursive
+#      next_layer() of the scripts used to. Which edges get used at which depth depends on that order (an edge
+#      is used by the first branch that reaches it, shallow or deep), so this is what keeps the per-depth counts
+#      the same as they always were. It keeps its own stack, so there is no recursion to run into Python's
+#      recursion limit.
+#
+# TailMemo remembers the tail of every keyword, so a keyword that is in hundreds of rows is only walked once and
+#    every other time its counts are just added in. It can also fetch the tails of a whole batch of keywords with
+#    one call (see graph_access.GraphBackend.tails_many).
+#
+# Sources:
+#    https://docs.python.org/3/library/collections.html#collections.OrderedDict
+
+from collections import OrderedDict
+
+### Functions ######################################################################################################################
+
+# Normalizes a uri that came out of ConceptNet so that it never ends with a ']' but always ends with a '/'.
+#    This is the form the uris are stored in class_words.
+# Input: the uri string
+# Return: the normalized uri string
+def clean_uri(uri):
+    if uri[-1] == ']':
+        uri = uri[:-1]
+    if uri[-1] != '/':
+        uri += '/'
+    return uri
+
+# Takes the id of the node a walk is at and an edge out of it and returns what add_edge() in the scripts recorded
+#    for it: the id of the node to go on to and the uri to count. The uri of the edge looks like
+#    '/a/[/r/IsA/,/c/en/dog/n/,/c/en/animal/]', so the start node's uri is the second piece of it and the end
+#    node's uri is the third. The uri counted is the one of node_id's own end of the edge, so a node is counted
+#    once for every new edge that is walked out of it.
+# Input: node_id = the id of the node we came from
+#        edge = the edge tuple, (id, uri, relation_id, start_id, end_id, weight)
+# Return: (other_id, uri), the uri is cleaned up with clean_uri()
+def get_other_node(node_id, edge):
+    split_uri = edge[1].split(',')
+    # If the id is the start_id
+    if node_id == edge[3]:
+        return edge[4], clean_uri(split_uri[1])
+    return edge[3], clean_uri(split_uri[2])
+
+# The same as get_other_node() for an edge of the keyword itself. The scripts hand add_edge() the keyword's uri
+#    there instead of its id, so it never matches the start_id: the end node's uri is counted and the walk goes
+#    on to the start node, which is the keyword itself when the keyword is the start of the edge.
+# Input: edge = the edge tuple
+# Return: (start_id, end_uri)
+def get_keyword_other_node(edge):
+    return edge[3], clean_uri(edge[1].split(',')[2])
+
+# Returns the id of the other node of the edge, without splitting the uri out of it
+def other_node_id(node_id, edge):
+    if node_id == edge[3]:
+        return edge[4]
+    return edge[3]
+
+# Turns a list of (uri, depth) records into a list of (uri, depth, count), with each (uri, depth) only once and in
+#    the order it was first recorded
+def count_records(records):
+    counts = {}
+    for record in records:
+        counts[record] = counts.get(record, 0) + 1
+    return [(uri, depth, count) for (uri, depth), count in counts.items()]
+
+# Fetches the edges of every node the walk of a tail can go into, one depth level at a time. Only the nodes fewer
+#    than max_depth edges from the keyword are ever gone into (their edges used), so those are the ones fetched.
+#    Every level is one query_edges_many call, so a tail of tail_length edges costs at most tail_length queries no
+#    matter how wide it gets.
+# Input: frontier = list of the node ids depth edges from the keyword, [keyword_id] with a depth of 0
+#        depth = how many edges the frontier is from the keyword
+#        query_edges_many = function that takes a list of node ids and returns a dictionary of {node_id : [edges]}
+#        max_depth = how many edges out the tail goes, this is the tail_length
+#        neighbourhoods = dictionary of {node_id : [edges]} to fill, nodes that are already in it are not fetched
+#            again, so it can be shared by all of the keywords of a row
+#        reached = set of the node ids the walk has reached so far (the frontier and the nodes before it), or None
+# Return: the new nodes reached max_depth edges out, in the order they were reached. These are the frontier the
+#    fetch stopped at, the walk never goes into them so their edges are not fetched
+def fetch_tail_edges(frontier, depth, query_edges_many, max_depth, neighbourhoods, reached=None):
+    if reached is None:
+        reached = set(frontier)
+    while depth < max_depth and len(frontier) > 0:
+        missing = [node_id for node_id in frontier if node_id not in neighbourhoods]
+        if len(missing) > 0:
+            neighbourhoods.update(query_edges_many(missing))
+        # A dict is used as an ordered set, so each node is only in the next frontier once
+        next_frontier = {}
+        for node_id in frontier:
+            for edge in neighbourhoods[node_id]:
+                other_id = other_node_id(node_id, edge)
+                if other_id not in reached:
+                    reached.add(other_id)
+                    next_frontier[other_id] = None
+        frontier = list(next_frontier)
+        depth = depth + 1
+    return frontier
+
+# Fetches the edges of the tails of many keywords at once, the same as fetch_tail_edges() for each of them but with
+#    one query_edges_many call per depth level for all of them.
+# Input: keyword_ids = list of keyword node ids
+#        query_edges_many, max_depth = same as for fetch_tail_edges()
+# Return: Dictionary of {keyword_id : neighbourhoods}, same as what fetch_tail_edges() fills
+def fetch_tail_edges_many(keyword_ids, query_edges_many, max_depth):
+    fetched = {}
+    frontiers = {keyword_id : [keyword_id] for keyword_id in dict.fromkeys(keyword_ids)}
+    reached = {keyword_id : {keyword_id} for keyword_id in frontiers}
+    for depth in range(max_depth):
+        missing = list(dict.fromkeys(node_id for keyword_id in frontiers for node_id in frontiers[keyword_id] if node_id not in fetched))
+        if len(missing) > 0:
+            fetched.update(query_edges_many(missing))
+        for keyword_id in frontiers:
+            # Every node of the level is already fetched, so this does not query anything
+            frontiers[keyword_id] = fetch_tail_edges(frontiers[keyword_id], depth, query_edges_many, depth + 1, fetched, reached[keyword_id])
+    tails = {}
+    for keyword_id in frontiers:
+        frontier = set(frontiers[keyword_id])
+        tails[keyword_id] = {node_id : fetched[node_id] for node_id in reached[keyword_id] if node_id not in frontier}
+    return tails
+
+# Goes out the tail of a keyword depth first, over edges that were already fetched, and gives back every node it
+#    reaches in the same order and at the same depth the recursive next_layer() of the scripts recorded them:
+#    - every edge of the keyword is used, even ones that are already in edge_check, and each one is followed all
+#      the way out before the next one
+#    - past the keyword an edge is only used if it is not in edge_check yet, and using it adds it
+#    - a used edge records the uri get_other_node() gives for it (get_keyword_other_node() for the edges of the
+#      keyword) at the depth of the edge, then the walk goes into the node it gives if the depth is less than
+#      max_depth
+#    So an edge is used at the depth the first branch that reaches it is at, even when a shorter branch after it
+#    reaches it too. Going into a node again (from another edge) goes over its edges again, the same way
+#    next_layer() queried it again. The walk keeps its own stack, so there is no recursion.
+# Input: keyword_id = the node id of the keyword, this is depth 0
+#        neighbourhoods = dictionary of {node_id : [edges]} with the edges of every node fewer than max_depth
+#            edges from the keyword, see fetch_tail_edges()
+#        max_depth = how many edges out to go, this is the tail_length
+#        edge_check = set of the edge ids that have already been used, updated in place so it can be shared
+#            between all of the keywords of a row (the same way the global edge_check was)
+#        checked_edges = a set to add the edges used past the keyword to, or None
+# Return: list of (uri, depth) in the order they were reached, a uri is in it once for every edge that reached it
+#    at that depth, so these are the counts update_class_words records
+def tail_records(keyword_id, neighbourhoods, max_depth, edge_check, checked_edges=None):
+    records = []
+    for edge in neighbourhoods[keyword_id]:
+        edge_check.add(edge[0])
+        other_id, uri = get_keyword_other_node(edge)
+        records.append((uri, 1))
+        if max_depth < 2:
+            continue
+        # Each entry is [node id, the depth of its edges, the index of the next edge to look at]
+        stack = [[other_id, 2, 0]]
+        while len(stack) > 0:
+            top = stack[-1]
+            node_edges = neighbourhoods[top[0]]
+            if top[2] == len(node_edges):
+                stack.pop()
+                continue
+            edge = node_edges[top[2]]
+            top[2] = top[2] + 1
+            # Checking for cycles here:
+            if edge[0] in edge_check:
+                continue
+            edge_check.add(edge[0])
+            if checked_edges is not None:
+                checked_edges.add(edge[0])
+            other_id, uri = get_other_node(top[0], edge)
+            records.append((uri, top[1]))
+            if top[1] < max_depth:
+                stack.append([other_id, top[1] + 1, 0])
+    return records
+
+### Classes ########################################################################################################################
+
+# Memoizes the tail of each keyword as its (uri, depth, count) records, for a fixed query_edges_many and max_depth.
+#
+# The keywords of a row share edge_check, so a keyword's tail can be cut short by the keywords before it in the
+#    row. The remembered tail is the one walked with nothing used yet, and it is only used when it is exactly what
+#    tail_records() would give in the row: none of the edges it used past the keyword are in edge_check. (The
+#    keyword's own edges are always used, and every edge the walk looks at past the keyword is one it used, so
+#    then every check comes out the same.) Otherwise the tail is walked again with the row's edge_check, same as
+#    without the memo, so the counts always come out the same.
+class TailMemo:
+    # Input: query_edges_many = same as for fetch_tail_edges()
+    #        max_depth = how many edges out to go, this is the tail_length
+    #        max_size = the most keywords to remember, the least recently used ones are forgotten past this
+    #        fetch_many = function that takes a list of keyword node ids and returns {keyword_id : neighbourhoods}
+    #            the same as fetch_tail_edges_many(), or None to fetch the tails with query_edges_many
+    def __init__(self, query_edges_many, max_depth, max_size=10000, fetch_many=None):
+        self.query_edges_many = query_edges_many
+        self.max_depth = max_depth
+        self.max_size = max_size
+        self.fetch_many = fetch_many
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.walked_again = 0
+
+    # Returns what is remembered about the tail of a keyword, walked with nothing used yet:
+    #    records = list of (uri, depth, count), the same as tail_counts() gives
+    #    edges = the edge_check the walk ends with
+    #    deep_edges = the edges the walk used past the keyword
+    # Input: keyword_id = the node id of the keyword
+    #        neighbourhoods = what fetch_tail_edges() fetched for the keyword
+    def entry(self, keyword_id, neighbourhoods):
+        edge_check = set()
+        deep_edges = set()
+        records = tail_records(keyword_id, neighbourhoods, self.max_depth, edge_check, deep_edges)
+        return {
+            "records" : count_records(records),
+            "edges" : frozenset(edge_check),
+            "deep_edges" : frozenset(deep_edges),
+        }
+
+    # Fetches the tail of the keyword and returns entry() for it.
+    # Input: keyword_id = the node id of the keyword
+    #        neighbourhoods = the row's dictionary of fetched edges to use and fill, or None
+    def walk(self, keyword_id, neighbourhoods=None):
+        if self.fetch_many is not None:
+            tail_edges = self.fetch_many([keyword_id])[keyword_id]
+            if neighbourhoods is not None:
+                neighbourhoods.update(tail_edges)
+            return self.entry(keyword_id, tail_edges)
+        if neighbourhoods is None:
+            neighbourhoods = {}
+        fetch_tail_edges([keyword_id], 0, self.query_edges_many, self.max_depth, neighbourhoods)
+        return self.entry(keyword_id, neighbourhoods)
+
+    # Remembers the tails of all of the keywords that are not remembered yet with one call to fetch_many, so a batch
+    #    of keywords costs one round trip. Does nothing without fetch_many.
+    # Input: keyword_ids = list of keyword node ids
+    def remember_many(self, keyword_ids):
+        if self.fetch_many is None or self.max_size == 0:
+            return
+        new_ids = [keyword_id for keyword_id in dict.fromkeys(keyword_ids) if keyword_id not in self.entries]
+        if len(new_ids) == 0:
+            return
+        tails = self.fetch_many(new_ids)
+        for keyword_id in new_ids:
+            self.entries[keyword_id] = self.entry(keyword_id, tails[keyword_id])
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        self.misses = self.misses + len(new_ids)
+
+    # Returns the tail of the keyword and updates edge_check, the same as tail_records() in the row would.
+    # Input: keyword_id, edge_check = same as for tail_records()
+    #        neighbourhoods = the row's dictionary of fetched edges, see fetch_tail_edges()
+    # Return: list of (uri, depth, count) for depth 1 up to max_depth, in the order the uris were reached
+    def tail_counts(self, keyword_id, edge_check, neighbourhoods):
+        if keyword_id in self.entries:
+            self.hits = self.hits + 1
+            self.entries.move_to_end(keyword_id)
+            entry = self.entries[keyword_id]
+        elif self.max_size > 0:
+            self.misses = self.misses + 1
+            entry = self.walk(keyword_id, neighbourhoods)
+            self.entries[keyword_id] = entry
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        else:
+            # Nothing is remembered, so just walk the tail in the row
+            fetch_tail_edges([keyword_id], 0, self.query_edges_many, self.max_depth, neighbourhoods)
+            return count_records(tail_records(keyword_id, neighbourhoods, self.max_depth, edge_check))
+        if entry["deep_edges"].isdisjoint(edge_check):
+            edge_check.update(entry["edges"])
+            return entry["records"]
+        # The row has already used part of this tail, so walk it again with the row's edge_check
+        self.walked_again = self.walked_again + 1
+        fetch_tail_edges([keyword_id], 0, self.query_edges_many, self.max_depth, neighbourhoods)
+        return count_records(tail_records(keyword_id, neighbourhoods, self.max_depth, edge_check))
+
+    # Returns a string of the hit/miss counters, useful for terminal output.
+    def stats_string(self):
+        return "Tail memo hits: " + str(self.hits) + ", misses: " + str(self.misses) + ", walked again in their row: " + str(self.walked_again) + ", keywords remembered: " + str(len(self.entries))